@@ -1,7 +1,9 @@
 from pydantic import BaseModel
 from typing import AsyncGenerator, List, Optional, Dict
+from contextlib import aclosing
 import re
 import json
+import asyncio
 
 from db.models import Project, Stack, User, UserType
 from sandbox.sandbox import DevSandbox
@@ -11,6 +13,12 @@ from agents.prompts import (
 from config import MAIN_MODEL, MAIN_PROVIDER
 from agents.diff import remove_file_changes
 from agents.providers import AgentTool, LLM_PROVIDERS
+from agents.file_tree import render_file_tree, render_index_tree
+from agents.images import image_payloads
+from agents.retrieval import FileIndex, render_relevant_files
+from agents.usage import record_usage
+from telemetry.metrics import SANDBOX_COMMAND_DURATION, SANDBOX_COMMANDS, observe_llm_stream
+from telemetry.tracing import span, span_stream
 
 
 USER_TYPE_STYLES: Dict[UserType, str] = {
@@ -42,11 +50,34 @@ class PartialChatMessage(BaseModel):
     delta_thinking_content: str = ""
 
 
+async def _main_model_stream(messages: List[Dict], tools: List[AgentTool], phase: str):
+    """The main model's chunks, accounting its token usage however the stream ends."""
+    model = LLM_PROVIDERS[MAIN_PROVIDER]()
+    try:
+        async with aclosing(
+            observe_llm_stream(
+                model.chat_complete_with_tools(
+                    messages=messages, tools=tools, model=MAIN_MODEL, temperature=0.0
+                ),
+                MAIN_PROVIDER,
+                MAIN_MODEL,
+                phase,
+            )
+        ) as stream:
+            async for chunk in stream:
+                yield chunk
+    finally:
+        record_usage(phase, MAIN_PROVIDER, MAIN_MODEL, model)
+
+
 def build_run_command_tool(sandbox: Optional[DevSandbox] = None):
     async def func(command: str, workdir: Optional[str] = None) -> str:
         if sandbox is None:
             return "This environment is still booting up! Try again in a minute."
-        result = await sandbox.run_command(command, workdir=workdir)
+        with span("tool.run_command", command=command[:200], workdir=workdir):
+            with SANDBOX_COMMAND_DURATION.time():
+                result, exit_code = await sandbox.exec_command(command, workdir=workdir)
+        SANDBOX_COMMANDS.labels(exit_code=exit_code).inc()
         print(f"$ {command} -> {result[:20]}")
         if result == "":
             result = "<empty response>"
@@ -72,7 +103,8 @@ def build_run_command_tool(sandbox: Optional[DevSandbox] = None):
 
 def build_navigate_to_tool(agent: "Agent"):
     async def func(path: str):
-        agent.working_page = path
+        with span("tool.navigate_to", path=path):
+            agent.working_page = path
         print(f"Navigating user to {path}")
         return "Navigating user to " + path
 
@@ -95,10 +127,6 @@ You are a full-stack expert developer on the platform Open Prompt Studio. You ar
 
 They will be able to edit files, run arbitrary commands in the sandbox, and navigate the user's browser.
 
-<project>
-{project_text}
-</project>
-
 <user>
 {user_text}
 </user>
@@ -107,13 +135,7 @@ They will be able to edit files, run arbitrary commands in the sandbox, and navi
 {stack_text}
 </stack>
 
-<project-files>
-{files_text}
-</project-files>
-
-<git-log>
-{git_log_text}
-</git-log>
+The <project>, its <project-files> and <git-log> follow this message.
 
 Answer the following questions:
 1. What is being asked by the most recent message?
@@ -149,6 +171,20 @@ You can customize the heading titles for each section but make them "thinking" r
 DO NOT include any code blocks in your response or text outside of the markdown h3 headings. This should be ADVICE ONLY.
 """
 
+PLAN_CONTEXT_PROMPT = """
+<project>
+{project_text}
+</project>
+
+<project-files>
+{files_text}
+</project-files>
+
+<git-log>
+{git_log_text}
+</git-log>
+"""
+
 SYSTEM_EXEC_PROMPT = """
 You are a full-stack expert developer on the platform Open Prompt Studio. You are given a <project> and a <stack> sandbox to develop in and a <plan> from a senior engineer.
 
@@ -187,10 +223,6 @@ You should literally output "... existing code ..." and write actual code in pla
 It is also useful to call out large blocks of code you explicitly removed (e.g. "// ... removed code for xyz ...")
 </formatting-instructions>
 
-<project>
-{project_text}
-</project>
-
 <user>
 {user_text}
 </user>
@@ -199,21 +231,32 @@ It is also useful to call out large blocks of code you explicitly removed (e.g.
 {stack_text}
 </stack>
 
+<tips>
+- When you use these code blocks the system will automatically apply the file changes (do not also use tools to do the same thing).
+- This apply will happen after you've finished your response and automatically include a git commit of all changes.
+- No need to run `npm run dev`, etc since the sandbox will handle that.
+- Files in <relevant-files> are up to date, do not `cat` them again. Read any other files you need.
+</tips>
+
+The <project>, its <project-files>, the current contents of the <relevant-files> and the <plan> follow this message. Follow the <plan>.
+"""
+
+EXEC_CONTEXT_PROMPT = """
+<project>
+{project_text}
+</project>
+
 <project-files>
 {files_text}
 </project-files>
 
+<relevant-files>
+{relevant_files_text}
+</relevant-files>
+
 <plan>
 {plan_text}
 </plan>
-
-<tips>
-- When you use these code blocks the system will automatically apply the file changes (do not also use tools to do the same thing).
-- This apply will happen after you've finished your response and automatically include a git commit of all changes.
-- No need to run `npm run dev`, etc since the sandbox will handle that.
-</tips>
-
-Follow the <plan>.
 """
 
 SYSTEM_FOLLOW_UP_PROMPT = """
@@ -307,7 +350,10 @@ class Agent:
             project_text=project_text,
             stack_text=stack_text,
         )
-        content = await chat_complete(system_prompt, conversation_text[-10000:])
+        with span("agent.follow_ups"):
+            content = await chat_complete(
+                system_prompt, conversation_text[-10000:], phase="follow_ups"
+            )
         try:
             return _parse_follow_ups(content)
         except Exception:
@@ -330,17 +376,23 @@ class Agent:
         for m in messages[:-2]:
             if m.images:
                 images.extend(m.images)
+        images = await image_payloads.get_payloads(images)
+        # The system prompt only depends on the stack and user so providers can
+        # reuse its cached prefix, per-turn context goes in its own message after it
         system_prompt = SYSTEM_PLAN_PROMPT.format(
-            project_text=project_text,
             stack_text=stack_text,
+            user_text=user_text,
+        )
+        context_prompt = PLAN_CONTEXT_PROMPT.format(
+            project_text=project_text,
             files_text=files_text,
             git_log_text=git_log_text,
-            user_text=user_text,
         )
 
         # Convert messages to provider format
         planning_messages = [
             {"role": "system", "content": system_prompt},
+            {"role": "system", "content": context_prompt},
             {
                 "role": "user",
                 "content": [
@@ -361,18 +413,21 @@ class Agent:
             },
         ]
 
-        model = LLM_PROVIDERS[MAIN_PROVIDER]()
-
-        async for chunk in model.chat_complete_with_tools(
-            messages=planning_messages,
-            tools=[],  # No tools needed for planning
-            model=MAIN_MODEL,
-            temperature=0.0,
-        ):
-            if chunk["type"] == "content":
-                yield PartialChatMessage(
-                    role="assistant", delta_thinking_content=chunk["content"]
-                )
+        # aclosing() closes the provider stream as soon as this turn stops
+        # (cancelled or abandoned) rather than whenever it is garbage collected
+        async with aclosing(
+            span_stream(
+                "agent.plan",
+                # No tools needed for planning
+                _main_model_stream(planning_messages, [], "plan"),
+                images=len(images),
+            )
+        ) as stream:
+            async for chunk in stream:
+                if chunk["type"] == "content":
+                    yield PartialChatMessage(
+                        role="assistant", delta_thinking_content=chunk["content"]
+                    )
 
     async def _git_log_text(self, git_log: str) -> str:
         git_text = "\n".join(
@@ -388,11 +443,14 @@ class Agent:
         messages: List[ChatMessage],
         sandbox_file_paths: Optional[List[str]] = None,
         sandbox_git_log: Optional[str] = None,
+        file_index: Optional[FileIndex] = None,
     ) -> AsyncGenerator[PartialChatMessage, None]:
         yield PartialChatMessage(role="assistant", delta_content="")
 
-        if sandbox_file_paths is not None:
-            files_text = "\n".join(sandbox_file_paths)
+        if file_index is not None and file_index.file_paths:
+            files_text = render_index_tree(file_index)
+        elif sandbox_file_paths is not None:
+            files_text = render_file_tree(sandbox_file_paths)
         else:
             files_text = "Sandbox is still booting..."
         if sandbox_git_log is not None:
@@ -404,51 +462,69 @@ class Agent:
         user_text = self._get_user_text()
 
         plan_content = ""
-        async for chunk in self._plan(
-            messages, project_text, git_log_text, stack_text, files_text, user_text
-        ):
-            yield chunk
-            plan_content += chunk.delta_thinking_content
+        async with aclosing(
+            self._plan(
+                messages, project_text, git_log_text, stack_text, files_text, user_text
+            )
+        ) as plan_stream:
+            async for chunk in plan_stream:
+                yield chunk
+                plan_content += chunk.delta_thinking_content
 
         system_prompt = SYSTEM_EXEC_PROMPT.format(
-            project_text=project_text,
             stack_text=stack_text,
+            user_text=user_text,
+        )
+        relevant_files = []
+        if file_index is not None:
+            if self.sandbox is not None:
+                # Other turns (or a previous turn's shielded apply) may have written
+                # files since the index was last refreshed; unchanged files cost a stat
+                await file_index.refresh(self.sandbox.sandbox_path, file_index.file_paths)
+            # Inline the files the request and plan point at, saving the model
+            # run_command round-trips to read them
+            relevant_files = file_index.relevant_files(
+                f"{messages[-1].content}\n{plan_content}"
+            )
+        context_prompt = EXEC_CONTEXT_PROMPT.format(
+            project_text=project_text,
             files_text=files_text,
+            relevant_files_text=render_relevant_files(relevant_files),
             plan_text=plan_content,
-            user_text=user_text,
+        )
+
+        message_images = await asyncio.gather(
+            *[image_payloads.get_payloads(message.images or []) for message in messages]
         )
 
         # Convert messages to provider format
         exec_messages = [
             {"role": "system", "content": system_prompt},
+            {"role": "system", "content": context_prompt},
             *[
                 {
                     "role": message.role,
                     "content": [{"type": "text", "text": message.content}]
-                    + (
-                        []
-                        if not message.images
-                        else [
-                            {"type": "image_url", "image_url": {"url": img}}
-                            for img in message.images
-                        ]
-                    ),
+                    + [
+                        {"type": "image_url", "image_url": {"url": img}}
+                        for img in images
+                    ],
                 }
-                for message in messages
+                for message, images in zip(messages, message_images)
             ],
         ]
         tools = [build_run_command_tool(self.sandbox), build_navigate_to_tool(self)]
 
-        model = LLM_PROVIDERS[MAIN_PROVIDER]()
-        async for chunk in model.chat_complete_with_tools(
-            messages=exec_messages,
-            tools=tools,
-            model=MAIN_MODEL,
-            temperature=0.0,
-        ):
-            if chunk["type"] == "content":
-                yield PartialChatMessage(
-                    role="assistant", delta_content=chunk["content"]
-                )
-            elif chunk["type"] == "tool_calls":
-                yield PartialChatMessage(role="assistant", delta_content="\n\n")
\ No newline at end of file
+        async with aclosing(
+            span_stream(
+                "agent.exec",
+                _main_model_stream(exec_messages, tools, "exec"),
+                messages=len(messages),
+                relevant_files=len(relevant_files),
+            )
+        ) as stream:
+            async for chunk in stream:
+                if chunk["type"] == "content":
+                    yield PartialChatMessage(role="assistant", delta_content=chunk["content"])
+                elif chunk["type"] == "tool_calls":
+                    yield PartialChatMessage(role="assistant", delta_content="\n\n")
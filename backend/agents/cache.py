@@ -0,0 +1,144 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import (
+    COMPLETION_CACHE_MAX_ENTRIES,
+    COMPLETION_CACHE_TTL_SECONDS,
+    COMPLETION_CACHE_URL,
+)
+from telemetry.metrics import COMPLETION_CACHE_LOOKUPS
+
+_metadata = MetaData()
+
+# Lives outside the alembic migrations since it may sit in its own SQLite file
+completion_cache_table = Table(
+    "completion_cache",
+    _metadata,
+    Column("key", String, primary_key=True),
+    Column("response", Text),
+    Column("expires_at", Float, index=True),
+)
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def completion_key(
+    provider: str, model: str, system_prompt: str, user_prompt: str, temperature: float
+) -> str:
+    return _hash(
+        f"{provider}|{model}|{temperature}|{_hash(system_prompt)}|{_hash(user_prompt)}"
+    )
+
+
+class CompletionCache:
+    """Caches deterministic (temperature 0) completions in an LRU, backed by an optional database."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._engine = None
+        if url:
+            self._engine = create_engine(url)
+            _metadata.create_all(self._engine)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _put_memory(self, key: str, response: str, expires_at: float):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_db(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                select(completion_cache_table.c.response, completion_cache_table.c.expires_at)
+                .where(
+                    completion_cache_table.c.key == key,
+                    completion_cache_table.c.expires_at >= time.time(),
+                )
+            ).first()
+        return (row.response, row.expires_at) if row else None
+
+    def _put_db(self, key: str, response: str, expires_at: float):
+        dialect = postgresql if self._engine.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(completion_cache_table).values(
+            key=key, response=response, expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[completion_cache_table.c.key],
+            set_={"response": response, "expires_at": expires_at},
+        )
+        with self._engine.begin() as conn:
+            conn.execute(stmt)
+            conn.execute(
+                delete(completion_cache_table).where(
+                    completion_cache_table.c.expires_at < time.time()
+                )
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self._get_memory(key)
+        if response is not None:
+            self.memory_hits += 1
+            COMPLETION_CACHE_LOOKUPS.labels(result="memory_hit").inc()
+            return response
+        if self._engine is not None:
+            try:
+                entry = await asyncio.to_thread(self._get_db, key)
+            except Exception as e:
+                print(f"Completion cache lookup failed: {e}")
+                entry = None
+            if entry is not None:
+                self.db_hits += 1
+                COMPLETION_CACHE_LOOKUPS.labels(result="db_hit").inc()
+                self._put_memory(key, *entry)
+                return entry[0]
+        self.misses += 1
+        COMPLETION_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    async def put(self, key: str, response: str):
+        expires_at = time.time() + self.ttl_seconds
+        self._put_memory(key, response, expires_at)
+        if self._engine is not None:
+            try:
+                await asyncio.to_thread(self._put_db, key, response, expires_at)
+            except Exception as e:
+                print(f"Completion cache write failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+
+completion_cache = CompletionCache(
+    COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_TTL_SECONDS, COMPLETION_CACHE_URL
+)
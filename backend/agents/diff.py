@@ -5,6 +5,7 @@ import asyncio
 
 from sandbox.sandbox import DevSandbox
 from agents.prompts import chat_complete
+from telemetry.tracing import span
 
 
 class FileChange(BaseModel):
@@ -68,6 +69,7 @@ Respond ONLY with the updated content in a code block.
 {tips}
 </adjustments>
 """.strip(),
+        phase="smart_diff",
     )
     return _extract_code_block(output)
 
@@ -102,13 +104,14 @@ async def parse_file_changes(sandbox: DevSandbox, content: str) -> List[FileChan
         ]
         if all(skip_conditions):
             return change
-        try:
-            original_content = await sandbox.read_file_contents(change.path)
-        except Exception:
-            original_content = "(file does not yet exist)"
-        new_content = await _apply_smart_diff(
-            original_content, change.diff, "\n".join([f" - {t}" for t in tips])
-        )
+        with span("diff.smart_diff", path=change.path, tips=len(tips)):
+            try:
+                original_content = await sandbox.read_file_contents(change.path)
+            except Exception:
+                original_content = "(file does not yet exist)"
+            new_content = await _apply_smart_diff(
+                original_content, change.diff, "\n".join([f" - {t}" for t in tips])
+            )
         print(f"Applying smart diff to {change.path}, reasons: {skip_conditions}")
         return FileChange(
             path=change.path,
@@ -116,7 +119,8 @@ async def parse_file_changes(sandbox: DevSandbox, content: str) -> List[FileChan
             content=new_content,
         )
 
-    changes = await asyncio.gather(*[_render_diff(change) for change in changes])
+    with span("diff.parse_file_changes", files=len(changes)):
+        changes = await asyncio.gather(*[_render_diff(change) for change in changes])
 
     return changes
 
@@ -0,0 +1,111 @@
+import os
+from collections import Counter
+from typing import Dict, List, Tuple
+from weakref import WeakKeyDictionary
+
+from agents.retrieval import FileIndex, estimate_tokens
+from config import FILE_TREE_TOKEN_BUDGET
+
+ROOT = "/app/"
+# Directories with more files than this only list the first few, then a summary
+MAX_FILES_PER_DIR = 30
+FILES_SHOWN_IN_LARGE_DIR = 10
+_INDENT = "  "
+
+
+class _Dir:
+    def __init__(self):
+        self.dirs: Dict[str, "_Dir"] = {}
+        self.files: List[str] = []
+        self.extensions: Counter = Counter()
+
+    @property
+    def file_count(self) -> int:
+        return sum(self.extensions.values())
+
+
+def _build_tree(paths: List[str]) -> _Dir:
+    root = _Dir()
+    for path in paths:
+        parts = path.removeprefix(ROOT).split("/")
+        ext = os.path.splitext(parts[-1])[1] or parts[-1]
+        node = root
+        node.extensions[ext] += 1
+        for part in parts[:-1]:
+            node = node.dirs.setdefault(part, _Dir())
+            node.extensions[ext] += 1
+        node.files.append(parts[-1])
+    return root
+
+
+def _summary(extensions: Counter) -> str:
+    total = sum(extensions.values())
+    common = [f"{count} {ext}" for ext, count in extensions.most_common(3)]
+    if len(extensions) > 3:
+        common.append("...")
+    return f"{total} file{'s' if total != 1 else ''}: {', '.join(common)}"
+
+
+def _render_dir(node: _Dir, level: int, depth: int) -> List[str]:
+    pad = _INDENT * level
+    lines = []
+    for name in sorted(node.dirs):
+        child = node.dirs[name]
+        # Collapse single-directory chains like frontend/src/components/
+        label = name
+        while len(child.dirs) == 1 and not child.files:
+            only = next(iter(child.dirs))
+            label, child = f"{label}/{only}", child.dirs[only]
+        if depth == 0:
+            lines.append(f"{pad}{label}/ ({_summary(child.extensions)})")
+        else:
+            lines.append(f"{pad}{label}/")
+            lines.extend(_render_dir(child, level + 1, depth - 1))
+    files = sorted(node.files)
+    if len(files) > MAX_FILES_PER_DIR:
+        rest = files[FILES_SHOWN_IN_LARGE_DIR:]
+        files = files[:FILES_SHOWN_IN_LARGE_DIR]
+        rest_extensions = Counter(os.path.splitext(f)[1] or f for f in rest)
+        lines.extend(f"{pad}{f}" for f in files)
+        lines.append(f"{pad}... {_summary(rest_extensions)}")
+    else:
+        lines.extend(f"{pad}{f}" for f in files)
+    return lines
+
+
+def _max_depth(node: _Dir) -> int:
+    return 1 + max((_max_depth(child) for child in node.dirs.values()), default=0)
+
+
+def render_file_tree(paths: List[str], token_budget: int = FILE_TREE_TOKEN_BUDGET) -> str:
+    """Indented tree of the sandbox files under /app/, fitted to the token budget by
+    summarizing the deepest directories first (file counts and extensions)."""
+    if not paths:
+        return "No files yet."
+    root = _build_tree(paths)
+    for depth in range(_max_depth(root), -1, -1):
+        text = "\n".join([ROOT, *_render_dir(root, 1, depth)])
+        if estimate_tokens(text) <= token_budget:
+            return text
+    # Even the top level alone is too large, cut it off
+    lines, used = [], 0
+    for line in text.split("\n"):
+        used += estimate_tokens(line) + 1
+        if used > token_budget:
+            lines.append(f"{_INDENT}... ({_summary(root.extensions)} in total)")
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Per index: (version, rendered tree)
+_tree_cache: "WeakKeyDictionary[FileIndex, Tuple[int, str]]" = WeakKeyDictionary()
+
+
+def render_index_tree(index: FileIndex) -> str:
+    """render_file_tree() of the index's files, re-rendered only when its version changes."""
+    cached = _tree_cache.get(index)
+    if cached is None or cached[0] != index.version:
+        cached = (index.version, render_file_tree(index.file_paths))
+        _tree_cache[index] = cached
+    return cached[1]
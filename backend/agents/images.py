@@ -0,0 +1,193 @@
+import io
+import re
+import math
+import base64
+import asyncio
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from config import (
+    IMAGE_CACHE_MAX_BYTES,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_MAX_PIXELS,
+    IMAGE_QUALITY,
+    UPLOADS_DIR,
+)
+
+UPLOADED_IMAGE_PREFIX = "/api/uploads/images/"
+# Uploads under this key prefix are preprocessed and named by their content hash
+PROCESSED_KEY_PREFIX = "sha256/"
+
+# (Pillow format, content type, file extension) of the encodings we produce
+_WEBP = ("WEBP", "image/webp", ".webp")
+_JPEG = ("JPEG", "image/jpeg", ".jpg")
+_PNG = ("PNG", "image/png", ".png")
+CONTENT_TYPES = {extension: content_type for _, content_type, extension in (_WEBP, _JPEG, _PNG)}
+# A processed upload's key, capturing its content hash
+PROCESSED_KEY_RE = re.compile(
+    rf"^{re.escape(PROCESSED_KEY_PREFIX)}([0-9a-f]{{64}})"
+    rf"({'|'.join(re.escape(extension) for extension in CONTENT_TYPES)})$"
+)
+
+
+class ProcessedImage:
+    def __init__(self, data: bytes, content_type: str, extension: str):
+        self.data = data
+        self.content_type = content_type
+        self.extension = extension
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+    @property
+    def file_key(self) -> str:
+        return f"{PROCESSED_KEY_PREFIX}{self.sha256}{self.extension}"
+
+
+def open_image(fp, max_dimension: int) -> Image.Image:
+    """Decodes an image file or file object, at least max_dimension on its longer side
+    where the format can decode at reduced size. Raises ValueError for data that is not
+    an image or has more than IMAGE_MAX_PIXELS pixels (e.g. a decompression bomb)."""
+    try:
+        image = Image.open(fp)
+        # Only the header has been read so far, reject before allocating the pixels
+        width, height = image.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise ValueError(f"Image is too large ({width}x{height} pixels)")
+        scale = max_dimension / max(width, height)
+        if image.format == "JPEG" and scale < 1:
+            # Let the decoder downscale by up to 8x, much cheaper than a full decode.
+            # draft() keeps both sides at least this size, so pass the scaled size
+            image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Not a valid image: {e}")
+    return image
+
+
+def preprocess_image(data: bytes) -> ProcessedImage:
+    """Downsizes to IMAGE_MAX_DIMENSION and re-encodes to WebP (JPEG or PNG when Pillow
+    lacks WebP). Raises ValueError for data that is not an image or is too large."""
+    image = open_image(io.BytesIO(data), IMAGE_MAX_DIMENSION)
+    # Phone photos are often stored sideways with an EXIF rotation
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+    has_alpha = image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if features.check("webp"):
+        fmt, content_type, extension = _WEBP
+    else:
+        fmt, content_type, extension = _PNG if has_alpha else _JPEG
+    image = image.convert("RGBA" if has_alpha and fmt != "JPEG" else "RGB")
+
+    out = io.BytesIO()
+    if fmt == "PNG":
+        image.save(out, fmt, optimize=True)
+    else:
+        image.save(out, fmt, quality=IMAGE_QUALITY)
+    return ProcessedImage(out.getvalue(), content_type, extension)
+
+
+def _data_url(content_type: str, data: bytes) -> str:
+    return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+
+
+class ImagePayloadCache:
+    """LRU of the data URLs sent to models for chat images, bounded by total size.
+
+    Uploaded images are read from disk once; inline data URLs are preprocessed
+    once, so repeated turns resend the same small payloads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _get(self, key: str) -> Optional[str]:
+        payload = self._entries.get(key)
+        if payload is not None:
+            self._entries.move_to_end(key)
+        return payload
+
+    def _put(self, key: str, payload: str):
+        if len(payload) > self.max_bytes:
+            return
+        self._entries[key] = payload
+        self._size += len(payload)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def get_payload(self, image: str) -> Optional[str]:
+        """A data URL for an uploaded image or inline data URL, other URLs as is.
+        None when the uploaded image no longer exists."""
+        if image.startswith(UPLOADED_IMAGE_PREFIX):
+            key = image
+            load = _load_uploaded
+        elif image.startswith("data:"):
+            key = hashlib.sha256(image.encode()).hexdigest()
+            load = _load_data_url
+        else:
+            return image
+        payload = self._get(key)
+        if payload is not None:
+            return payload
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            payload = self._get(key)
+            if payload is None:
+                payload = await asyncio.to_thread(load, image)
+                if payload is not None:
+                    self._put(key, payload)
+        self._locks.pop(key, None)
+        return payload
+
+    async def get_payloads(self, images: List[str]) -> List[str]:
+        """Payloads for the images, without repeats of the same image."""
+        payloads = await asyncio.gather(*[self.get_payload(image) for image in images])
+        return [payload for payload in dict.fromkeys(payloads) if payload is not None]
+
+
+def _load_uploaded(url: str) -> Optional[str]:
+    file_key = url.removeprefix(UPLOADED_IMAGE_PREFIX)
+    content_type = None
+    if file_key.startswith(PROCESSED_KEY_PREFIX):
+        match = PROCESSED_KEY_RE.match(file_key)
+        content_type = CONTENT_TYPES.get(match.group(2)) if match else None
+        if content_type is None:
+            return None
+    root = Path(UPLOADS_DIR).resolve()
+    path = (root / file_key).resolve()
+    if not path.is_relative_to(root):
+        return None
+    try:
+        with path.open("rb") as f:
+            data = f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    if content_type is not None:
+        return _data_url(content_type, data)
+    # Uploaded before preprocessing existed
+    try:
+        processed = preprocess_image(data)
+    except ValueError:
+        return None
+    return _data_url(processed.content_type, processed.data)
+
+
+def _load_data_url(url: str) -> str:
+    try:
+        processed = preprocess_image(base64.b64decode(url.partition(",")[2]))
+    except ValueError:
+        # Leave anything we can't read for the provider to judge
+        return url
+    return _data_url(processed.content_type, processed.data)
+
+
+image_payloads = ImagePayloadCache(IMAGE_CACHE_MAX_BYTES)
@@ -1,9 +1,13 @@
 import datetime
+import os
 import re
 from typing import List, Tuple
 
 from config import FAST_MODEL, MAIN_MODEL, FAST_PROVIDER
 from agents.providers import LLM_PROVIDERS
+from agents.cache import completion_cache, completion_key
+from agents.usage import record_usage
+from telemetry.metrics import observe_llm_call
 
 
 async def chat_complete(
@@ -11,11 +15,25 @@ async def chat_complete(
     user_prompt: str,
     fast: bool = True,
     temperature: float = 0.0,
+    phase: str = "helper",
 ) -> str:
     model = FAST_MODEL if fast else MAIN_MODEL
-    return await LLM_PROVIDERS[FAST_PROVIDER]().chat_complete(
-        system_prompt, user_prompt, model, temperature
-    )
+    # Only temperature 0 completions are repeatable enough to reuse
+    key = None
+    if temperature == 0.0:
+        key = completion_key(FAST_PROVIDER, model, system_prompt, user_prompt, temperature)
+        cached = await completion_cache.get(key)
+        if cached is not None:
+            return cached
+    llm = LLM_PROVIDERS[FAST_PROVIDER]()
+    try:
+        with observe_llm_call(FAST_PROVIDER, model, phase):
+            content = await llm.chat_complete(system_prompt, user_prompt, model, temperature)
+    finally:
+        record_usage(phase, FAST_PROVIDER, model, llm)
+    if key is not None and content:
+        await completion_cache.put(key, content)
+    return content
 
 
 async def name_chat(seed_prompt: str) -> Tuple[str, str, str]:
@@ -44,7 +62,7 @@ session: Build the UI for Astro App
 </example>
 """
     user_prompt = seed_prompt
-    content = await chat_complete(system_prompt, user_prompt)
+    content = await chat_complete(system_prompt, user_prompt, phase="name_chat")
     try:
         project, project_description, session = re.search(
             r"project: (.*)\nproject-description: (.*)\nsession: (.*)", content
@@ -72,10 +90,30 @@ Given the following changes, write a commit message for the changes.
 - Do not use markdown formatting, newlines, or other formatting.
 """.strip(),
         content[:100000],
+        phase="commit_message",
     )
     return re.sub(r"[^\w\s]+", "", msg)
 
 
+def local_commit_message(prompt: str, file_stats: List[Tuple[str, int, int, bool]]) -> str:
+    """Build a commit message from (path, added, removed, is_new) stats and the user's request."""
+    names = [os.path.basename(path) for path, _, _, _ in file_stats]
+    files_text = ", ".join(names[:3])
+    if len(names) > 3:
+        files_text += f" and {len(names) - 3} more"
+    verb = "Add" if all(is_new for _, _, _, is_new in file_stats) else "Update"
+    added = sum(a for _, a, _, _ in file_stats)
+    removed = sum(r for _, _, r, _ in file_stats)
+    msg = f"{verb} {files_text} (+{added} -{removed})"
+
+    summary = re.sub(r"\s+", " ", prompt).strip()
+    if len(summary) > 60:
+        summary = summary[:60].rsplit(" ", 1)[0] + "..."
+    if summary:
+        msg += f" for {summary}"
+    return re.sub(r"[^\w\s+\-(),.]+", "", msg)
+
+
 async def pick_stack(seed_prompt: str, stack_titles: List[str], default: str) -> str:
     system_prompt = f"""
 You are a helpful full-stack developer helping advise a user on which stack to use.
@@ -98,7 +136,7 @@ stack: ...
 
 Respond with <output-format> without the tags.
 """
-    content = await chat_complete(system_prompt, seed_prompt)
+    content = await chat_complete(system_prompt, seed_prompt, phase="pick_stack")
     try:
         # Extract stack from response
         stack = re.search(r"stack: (.*)", content).group(1).strip()
@@ -1,12 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, AsyncGenerator, Callable, Type
+from collections import OrderedDict
+from typing import Dict, Any, List, AsyncGenerator, Callable, Optional, Type
 from pydantic import BaseModel
+import re
 import json
 import base64
+import asyncio
+import hashlib
 import httpx
 from google.generativeai import GenerativeModel
 import google.generativeai as genai
-from config import GEMINI_API_KEY, DEEPSEEK_API_KEY
+from config import GEMINI_API_KEY, DEEPSEEK_API_KEY, FAKE_LLM_SCRIPT, FAKE_LLM_TOKENS_PER_SECOND
 
 
 class AgentTool(BaseModel):
@@ -35,7 +39,38 @@ class AgentTool(BaseModel):
         }
 
 
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Part of prompt_tokens served from the provider's prompt cache
+    cached_tokens: int = 0
+    # API requests made, e.g. one per tool call round of a chat_complete_with_tools()
+    requests: int = 0
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
 class LLMProvider(ABC):
+    # Summed over every request the instance made, set once a provider reports usage
+    usage: Optional[TokenUsage] = None
+
+    def _record_usage(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+        requests: int = 1,
+    ):
+        """Adds the usage a provider reported for one request (or part of one, with requests=0)."""
+        if self.usage is None:
+            self.usage = TokenUsage()
+        self.usage.prompt_tokens += prompt_tokens or 0
+        self.usage.completion_tokens += completion_tokens or 0
+        self.usage.cached_tokens += cached_tokens or 0
+        self.usage.requests += requests
+
     @abstractmethod
     async def chat_complete(
         self, system_prompt: str, user_prompt: str, model: str, temperature: float = 0.0
@@ -66,8 +101,18 @@ class GeminiLLMProvider(LLMProvider):
             combined_prompt,
             generation_config={"temperature": temperature}
         )
+        self._record_gemini_usage(response)
         return response.text
 
+    def _record_gemini_usage(self, response):
+        # Still counts the request when the response has no usage metadata
+        metadata = getattr(response, "usage_metadata", None)
+        self._record_usage(
+            getattr(metadata, "prompt_token_count", 0),
+            getattr(metadata, "candidates_token_count", 0),
+            getattr(metadata, "cached_content_token_count", 0),
+        )
+
     async def _handle_tool_call(self, tools: List[AgentTool], tool_call) -> str:
         tool_name = tool_call.get("name")
         arguments = tool_call.get("args", {})
@@ -93,6 +138,7 @@ class GeminiLLMProvider(LLMProvider):
                     generation_config={"temperature": temperature},
                     tools=[tool.to_gemini_tool() for tool in tools] if tools else None
                 )
+                self._record_gemini_usage(response)
                 
                 if response.candidates[0].content.parts[0].function_call:
                     tool_call = response.candidates[0].content.parts[0].function_call
@@ -125,7 +171,17 @@ class DeepseekLLMProvider(LLMProvider):
                 "temperature": temperature
             }
         )
-        return response.json()["choices"][0]["message"]["content"]
+        data = response.json()
+        self._record_deepseek_usage(data.get("usage"))
+        return data["choices"][0]["message"]["content"]
+
+    def _record_deepseek_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        cached = usage.get("prompt_cache_hit_tokens")
+        if cached is None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        self._record_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"), cached)
 
     async def _handle_tool_call(self, tools: List[AgentTool], tool_call) -> str:
         tool_name = tool_call["function"]["name"]
@@ -146,7 +202,10 @@ class DeepseekLLMProvider(LLMProvider):
         current_messages = messages.copy()
 
         while True:
-            response = await self.client.post(
+            # Streamed so a cancelled turn closes the connection instead of
+            # waiting for the whole completion
+            async with self.client.stream(
+                "POST",
                 f"{self.api_base}/chat/completions",
                 headers={"Authorization": f"Bearer {self.api_key}"},
                 json={
@@ -154,42 +213,182 @@ class DeepseekLLMProvider(LLMProvider):
                     "messages": current_messages,
                     "temperature": temperature,
                     "tools": [tool.to_deepseek_tool() for tool in tools] if tools else None,
-                    "stream": True
-                }
-            )
+                    "stream": True,
+                    # Token usage arrives in a final chunk before [DONE]
+                    "stream_options": {"include_usage": True},
+                },
+            ) as response:
+                finish_reason = None
+                # Tool calls stream in fragments keyed by index; the
+                # arguments only parse once the response is complete
+                round_calls: Dict[int, Dict[str, Any]] = {}
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if line.startswith("data:"):
+                        line = line[len("data:"):].strip()
+                    if not line:
+                        continue
+                    if line == "[DONE]":
+                        break
 
-            async for line in response.aiter_lines():
-                if not line.strip():
-                    continue
-                    
-                chunk = json.loads(line)
-                if chunk.get("choices")[0].get("delta").get("tool_calls"):
-                    tool_calls = chunk["choices"][0]["delta"]["tool_calls"]
-                    yield {"type": "tool_calls", "tool_calls": tool_calls}
-                    
-                    for tool_call in tool_calls:
-                        tool_result = await self._handle_tool_call(tools, tool_call)
-                        current_messages.append({
-                            "role": "assistant",
-                            "content": None,
-                            "tool_calls": tool_calls
-                        })
-                        current_messages.append({
-                            "role": "tool",
-                            "content": tool_result,
-                            "name": tool_call["function"]["name"]
-                        })
-                elif chunk.get("choices")[0].get("delta").get("content"):
-                    yield {
-                        "type": "content",
-                        "content": chunk["choices"][0]["delta"]["content"]
-                    }
-
-                if chunk["choices"][0].get("finish_reason") == "stop":
-                    return
+                    chunk = json.loads(line)
+                    self._record_deepseek_usage(chunk.get("usage"))
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta") or {}
+                    if delta.get("tool_calls"):
+                        for fragment in delta["tool_calls"]:
+                            call = round_calls.setdefault(fragment.get("index", len(round_calls)), {
+                                "id": None,
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""},
+                            })
+                            if fragment.get("id"):
+                                call["id"] = fragment["id"]
+                            function = fragment.get("function") or {}
+                            call["function"]["name"] += function.get("name") or ""
+                            call["function"]["arguments"] += function.get("arguments") or ""
+                    elif delta.get("content"):
+                        yield {
+                            "type": "content",
+                            "content": delta["content"]
+                        }
+
+                    # The usage chunk follows the finish reason, so keep
+                    # reading until [DONE] rather than stopping here
+                    finish_reason = chunk["choices"][0].get("finish_reason") or finish_reason
+
+            if finish_reason == "stop" or not round_calls:
+                return
+            tool_calls = [round_calls[index] for index in sorted(round_calls)]
+            yield {"type": "tool_calls", "tool_calls": tool_calls}
+
+            # One assistant message per round, followed by every result
+            current_messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": tool_calls
+            })
+            for tool_call in tool_calls:
+                tool_result = await self._handle_tool_call(tools, tool_call)
+                current_messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "content": tool_result,
+                    "name": tool_call["function"]["name"]
+                })
+
+
+_DEFAULT_FAKE_SCRIPT = {
+    # The first completion whose "match" appears in the system prompt is returned
+    "completions": [
+        {
+            "match": "name a project",
+            "response": "project: Bench App\nproject-description: An app used to benchmark the backend.\nsession: Benchmark session",
+        },
+        {"match": "which stack", "response": "reasoning: Benchmark run\nstack: React"},
+        {"match": "commit messages", "response": "Update benchmark component"},
+        {
+            "match": "follow up prompts",
+            "response": "<follow-ups>\n- Add a settings page\n- Improve the styling of the homepage\n- Add more dummy content\n</follow-ups>",
+        },
+    ],
+    "default_completion": "OK",
+    # Streamed for planning calls (no tools)
+    "plan": "### Analyzing your question...\n\nThe user wants a small component added to the app.\n\n### Figuring out what files to edit...\n\nCreate `/app/src/Bench.tsx` and list the project files first.",
+    # Streamed for tool-enabled calls, tool calls are run against the real tools
+    "exec": [
+        {"content": "Let me look at the project first."},
+        {"tool_call": {"name": "run_command", "arguments": {"command": "ls"}}},
+        {
+            "content": "Here is the new component:\n\n```tsx\n// /app/src/Bench.tsx\nexport default function Bench() {\n  return <div className=\"p-4\">Benchmark</div>;\n}\n```\n\nThe component is ready to use."
+        },
+    ],
+}
+
+
+def _load_fake_script() -> Dict[str, Any]:
+    if not FAKE_LLM_SCRIPT:
+        return _DEFAULT_FAKE_SCRIPT
+    with open(FAKE_LLM_SCRIPT) as f:
+        return {**_DEFAULT_FAKE_SCRIPT, **json.load(f)}
+
+
+class FakeLLMProvider(LLMProvider):
+    """Replays a scripted stream without any network calls, for benchmarks and offline development."""
+
+    # Hashes of leading system messages seen recently, reported as cached like a
+    # provider's prefix cache, which also only keeps recent prefixes
+    _seen_prefixes: "OrderedDict[str, None]" = OrderedDict()
+    _MAX_SEEN_PREFIXES = 64
+
+    def __init__(self):
+        self.script = _load_fake_script()
+        self.token_delay = 1.0 / FAKE_LLM_TOKENS_PER_SECOND if FAKE_LLM_TOKENS_PER_SECOND > 0 else 0.0
+
+    async def chat_complete(
+        self, system_prompt: str, user_prompt: str, model: str, temperature: float = 0.0
+    ) -> str:
+        content = self._complete(system_prompt, user_prompt)
+        self._record_usage(_estimate_tokens(system_prompt + user_prompt), _estimate_tokens(content))
+        return content
+
+    def _complete(self, system_prompt: str, user_prompt: str) -> str:
+        if "applies code changes" in system_prompt:
+            # Smart diffs: hand the diff back as the new file content
+            match = re.search(r"<diff>\s*(```[\s\S]*?```)\s*</diff>", user_prompt)
+            return match.group(1) if match else user_prompt
+        for completion in self.script["completions"]:
+            if completion["match"] in system_prompt:
+                return completion["response"]
+        return self.script["default_completion"]
+
+    def _remember_prefix(self, prefix: str) -> bool:
+        """Whether the prefix was seen recently."""
+        key = hashlib.sha256(prefix.encode()).hexdigest()
+        seen = key in self._seen_prefixes
+        self._seen_prefixes[key] = None
+        self._seen_prefixes.move_to_end(key)
+        while len(self._seen_prefixes) > self._MAX_SEEN_PREFIXES:
+            self._seen_prefixes.popitem(last=False)
+        return seen
+
+    async def _stream_text(self, text: str) -> AsyncGenerator[Dict[str, Any], None]:
+        for token in re.findall(r"\s*\S+", text):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            self._record_usage(0, 1, requests=0)
+            yield {"type": "content", "content": token}
+
+    async def chat_complete_with_tools(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[AgentTool],
+        model: str,
+        temperature: float = 0.0,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        prefix = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        cached = _estimate_tokens(prefix) if self._remember_prefix(prefix) else 0
+        self._record_usage(_estimate_tokens(json.dumps(messages)), 0, cached)
+        if not tools:
+            async for chunk in self._stream_text(self.script["plan"]):
+                yield chunk
+            return
+        for step in self.script["exec"]:
+            if "tool_call" in step:
+                call = step["tool_call"]
+                yield {"type": "tool_calls", "tool_calls": [call]}
+                tool = next((tool for tool in tools if tool.name == call["name"]), None)
+                if tool is None:
+                    raise ValueError(f"Unknown tool: {call['name']}")
+                await tool.func(**call["arguments"])
+            else:
+                async for chunk in self._stream_text(step["content"]):
+                    yield chunk
 
 
 LLM_PROVIDERS: Dict[str, Type[LLMProvider]] = {
     "gemini": GeminiLLMProvider,
     "deepseek": DeepseekLLMProvider,
+    "fake": FakeLLMProvider,
 }
\ No newline at end of file
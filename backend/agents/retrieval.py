@@ -0,0 +1,218 @@
+import os
+import re
+import math
+import asyncio
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+from config import RELEVANT_FILES_TOKEN_BUDGET, RELEVANT_FILES_TOP_K
+
+# Only source-like files are indexed and worth inlining
+INDEXED_EXTENSIONS = {
+    ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".vue", ".svelte", ".astro",
+    ".css", ".scss", ".html", ".json", ".md", ".py", ".yaml", ".yml", ".toml",
+}
+SKIPPED_FILES = {"package-lock.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb"}
+MAX_INDEXED_BYTES = 200 * 1024
+SYMBOL_EXTENSIONS = {".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".vue", ".svelte"}
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Extra score per query term naming an exported symbol or a path segment
+_SYMBOL_BOOST = 3.0
+_PATH_BOOST = 2.0
+# ...and for a file whose path appears verbatim in the query (e.g. the plan lists it)
+_EXACT_PATH_BOOST = 25.0
+
+_STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "from", "import", "export", "const",
+    "let", "var", "function", "return", "default", "class", "new", "true", "false",
+    "null", "undefined", "if", "else", "to", "of", "in", "is", "it", "a", "an", "be",
+    "we", "should", "will", "can", "use", "add", "make", "file", "files", "app", "src",
+}
+
+_WORD_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_EXPORT_RE = re.compile(
+    r"export\s+(?:default\s+)?(?:declare\s+)?(?:async\s+)?"
+    r"(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)"
+)
+_EXPORT_LIST_RE = re.compile(r"export\s*\{([^}]*)\}")
+_VUE_NAME_RE = re.compile(r"""\bname\s*:\s*['"]([\w-]+)['"]""")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercased identifiers plus their camelCase/snake_case parts."""
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in _STOPWORDS:
+            tokens.append(lower)
+        parts = [p.lower() for p in _CAMEL_RE.findall(word.replace("$", "_"))]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 2 and p not in _STOPWORDS)
+    return tokens
+
+
+def _extract_symbols(path: str, content: str) -> Set[str]:
+    ext = os.path.splitext(path)[1]
+    if ext not in SYMBOL_EXTENSIONS:
+        return set()
+    symbols = set(_EXPORT_RE.findall(content))
+    for names in _EXPORT_LIST_RE.findall(content):
+        for name in names.split(","):
+            # "a as b" exports b
+            name = name.strip().split(" as ")[-1].strip()
+            if name:
+                symbols.add(name)
+    if ext in (".vue", ".svelte"):
+        # Single file components are imported under their file name
+        symbols.add(os.path.splitext(os.path.basename(path))[0])
+        symbols.update(_VUE_NAME_RE.findall(content))
+    return {s.lower() for s in symbols}
+
+
+def _is_indexed(path: str) -> bool:
+    name = os.path.basename(path)
+    return name not in SKIPPED_FILES and os.path.splitext(name)[1] in INDEXED_EXTENSIONS
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class _Document:
+    def __init__(self, path: str, stamp: Tuple[float, int], content: str):
+        self.path = path
+        self.stamp = stamp
+        self.content = content
+        self.terms = Counter(_tokenize(content))
+        self.length = sum(self.terms.values())
+        self.symbols = _extract_symbols(path, content)
+        self.path_terms = set(_tokenize(path))
+
+
+def _scan(
+    root_path: str, file_paths: List[str], stamps: Dict[str, Tuple[float, int]]
+) -> Tuple[List[str], List[_Document]]:
+    """Paths to drop from the index (deleted or changed) and documents to (re-)add."""
+    wanted = {path for path in file_paths if _is_indexed(path)}
+    removed = [path for path in stamps if path not in wanted]
+    added = []
+    for path in wanted:
+        full_path = os.path.join(root_path, path.removeprefix("/app/"))
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            if path in stamps:
+                removed.append(path)
+            continue
+        stamp = (stat.st_mtime, stat.st_size)
+        if stamps.get(path) == stamp:
+            continue
+        if path in stamps:
+            removed.append(path)
+        if stat.st_size > MAX_INDEXED_BYTES:
+            continue
+        try:
+            with open(full_path, "r") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        added.append(_Document(path, stamp, content))
+    return removed, added
+
+
+class FileIndex:
+    """BM25 index over a sandbox's source files plus their exported TS/JS/Vue symbols.
+
+    refresh() only re-reads files whose mtime or size changed, so it is cheap
+    to call after every commit. version increments whenever the file list or the
+    indexed files change.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.file_paths: List[str] = []
+        self._docs: Dict[str, _Document] = {}
+        self._doc_freqs: Counter = Counter()
+        self._total_length = 0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, root_path: str, file_paths: List[str]):
+        async with self._lock:
+            stamps = {path: doc.stamp for path, doc in self._docs.items()}
+            # Files are read off the event loop, the index itself only changes on it
+            removed, added = await asyncio.to_thread(_scan, root_path, file_paths, stamps)
+            for path in removed:
+                self._remove(path)
+            for doc in added:
+                self._add(doc)
+            if removed or added or file_paths != self.file_paths:
+                self.file_paths = list(file_paths)
+                self.version += 1
+
+    def _add(self, doc: _Document):
+        self._docs[doc.path] = doc
+        self._doc_freqs.update(doc.terms.keys())
+        self._total_length += doc.length
+
+    def _remove(self, path: str):
+        doc = self._docs.pop(path)
+        self._doc_freqs.subtract(doc.terms.keys())
+        self._total_length -= doc.length
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """The most relevant files for the query as (path, score), best first."""
+        if not self._docs:
+            return []
+        terms = set(_tokenize(query))
+        n = len(self._docs)
+        avg_length = self._total_length / n or 1
+        scores = []
+        for doc in self._docs.values():
+            score = 0.0
+            for term in terms:
+                tf = doc.terms.get(term, 0)
+                if tf:
+                    df = self._doc_freqs[term]
+                    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                    score += idf * tf * (_K1 + 1) / (
+                        tf + _K1 * (1 - _B + _B * doc.length / avg_length)
+                    )
+                if term in doc.symbols:
+                    score += _SYMBOL_BOOST
+                if term in doc.path_terms:
+                    score += _PATH_BOOST
+            if doc.path in query or doc.path.removeprefix("/app/") in query:
+                score += _EXACT_PATH_BOOST
+            if score > 0:
+                scores.append((doc.path, score))
+        scores.sort(key=lambda item: -item[1])
+        return scores[:limit]
+
+    def relevant_files(
+        self,
+        query: str,
+        limit: int = RELEVANT_FILES_TOP_K,
+        token_budget: int = RELEVANT_FILES_TOKEN_BUDGET,
+    ) -> List[Tuple[str, str]]:
+        """(path, content) of the top files for the query that fit in the token budget."""
+        files = []
+        for path, _ in self.search(query, limit):
+            content = self._docs[path].content
+            tokens = estimate_tokens(content)
+            if tokens > token_budget:
+                continue
+            token_budget -= tokens
+            files.append((path, content))
+        return files
+
+
+def render_relevant_files(files: List[Tuple[str, str]]) -> str:
+    if not files:
+        return "No file contents included, use run_command to read files you need."
+    return "\n\n".join(
+        f'<file path="{path}">\n{content.rstrip()}\n</file>' for path, content in files
+    )
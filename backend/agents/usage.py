@@ -0,0 +1,111 @@
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from agents.providers import LLMProvider, TokenUsage
+from db.models import TurnUsage, UsageRollup
+from telemetry.metrics import LLM_TOKENS
+from telemetry.tracing import current_span
+
+
+class UsageTracker:
+    """Token usage of the LLM calls made within a track_usage() block, by (phase, provider, model)."""
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+
+    def add(self, phase: str, provider: str, model: str, usage: TokenUsage):
+        entry = self.entries.setdefault(
+            (phase, provider, model),
+            {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0},
+        )
+        entry["calls"] += usage.requests
+        entry["prompt_tokens"] += usage.prompt_tokens
+        entry["completion_tokens"] += usage.completion_tokens
+        entry["cached_tokens"] += usage.cached_tokens
+
+
+_current_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("_current_tracker", default=None)
+
+
+@contextmanager
+def track_usage():
+    """Collects usage recorded in this context (including tasks it spawns) into a UsageTracker."""
+    tracker = UsageTracker()
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+def record_usage(phase: str, provider: str, model: str, llm: LLMProvider):
+    """Accounts the tokens an LLM provider instance reported, if any."""
+    usage = llm.usage
+    if usage is None:
+        return
+    labels = {"provider": provider, "model": model, "phase": phase}
+    LLM_TOKENS.labels(kind="prompt", **labels).inc(usage.prompt_tokens)
+    LLM_TOKENS.labels(kind="completion", **labels).inc(usage.completion_tokens)
+    LLM_TOKENS.labels(kind="cached", **labels).inc(usage.cached_tokens)
+    # Per-call counts on the call's span, e.g. to check prompt prefix cache hits
+    call_span = current_span()
+    if call_span is not None:
+        call_span.set_attribute("llm.prompt_tokens", usage.prompt_tokens)
+        call_span.set_attribute("llm.completion_tokens", usage.completion_tokens)
+        call_span.set_attribute("llm.cached_tokens", usage.cached_tokens)
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.add(phase, provider, model, usage)
+
+
+def save_usage(
+    db: Session,
+    tracker: UsageTracker,
+    team_id: int,
+    project_id: Optional[int],
+    chat_id: Optional[int] = None,
+    trace_id: Optional[str] = None,
+):
+    """Stores a turn's usage rows and adds them to the team's daily rollups."""
+    if not tracker.entries:
+        return
+    now = datetime.datetime.now()
+    rollups: Dict[str, Dict[str, int]] = {}
+    for (phase, provider, model), entry in tracker.entries.items():
+        db.add(
+            TurnUsage(
+                created_at=now,
+                team_id=team_id,
+                project_id=project_id,
+                chat_id=chat_id,
+                trace_id=trace_id,
+                phase=phase,
+                provider=provider,
+                model=model,
+                **entry,
+            )
+        )
+        rollup = rollups.setdefault(phase, dict.fromkeys(entry, 0))
+        for key, value in entry.items():
+            rollup[key] += value
+    for phase, totals in rollups.items():
+        stmt = insert(UsageRollup).values(
+            team_id=team_id, project_id=project_id or 0, day=now.date(), phase=phase, **totals
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[
+                    UsageRollup.team_id,
+                    UsageRollup.project_id,
+                    UsageRollup.day,
+                    UsageRollup.phase,
+                ],
+                set_={key: getattr(UsageRollup, key) + stmt.excluded[key] for key in totals},
+            )
+        )
+    db.commit()
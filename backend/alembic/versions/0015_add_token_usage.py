@@ -0,0 +1,64 @@
+"""add token usage
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2025-02-10 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0015'
+down_revision: Union[str, None] = '0014'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # LLM token counts per chat turn, by phase and model
+    op.create_table('turn_usage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('team_id', sa.Integer(), nullable=True),
+        sa.Column('project_id', sa.Integer(), nullable=True),
+        sa.Column('chat_id', sa.Integer(), nullable=True),
+        sa.Column('trace_id', sa.String(), nullable=True),
+        sa.Column('phase', sa.String(), nullable=True),
+        sa.Column('provider', sa.String(), nullable=True),
+        sa.Column('model', sa.String(), nullable=True),
+        sa.Column('calls', sa.Integer(), nullable=True),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+        sa.Column('completion_tokens', sa.Integer(), nullable=True),
+        sa.Column('cached_tokens', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_turn_usage_id'), 'turn_usage', ['id'], unique=False)
+    op.create_index(op.f('ix_turn_usage_team_id'), 'turn_usage', ['team_id'], unique=False)
+    op.create_index(op.f('ix_turn_usage_project_id'), 'turn_usage', ['project_id'], unique=False)
+
+    # Daily totals per team, project and phase
+    op.create_table('usage_rollups',
+        sa.Column('team_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('phase', sa.String(), nullable=False),
+        sa.Column('calls', sa.BigInteger(), nullable=True),
+        sa.Column('prompt_tokens', sa.BigInteger(), nullable=True),
+        sa.Column('completion_tokens', sa.BigInteger(), nullable=True),
+        sa.Column('cached_tokens', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+        sa.PrimaryKeyConstraint('team_id', 'project_id', 'day', 'phase')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_rollups')
+    op.drop_index(op.f('ix_turn_usage_project_id'), table_name='turn_usage')
+    op.drop_index(op.f('ix_turn_usage_team_id'), table_name='turn_usage')
+    op.drop_index(op.f('ix_turn_usage_id'), table_name='turn_usage')
+    op.drop_table('turn_usage')
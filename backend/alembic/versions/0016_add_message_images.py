@@ -0,0 +1,27 @@
+"""add message images
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2025-02-12 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0016'
+down_revision: Union[str, None] = '0015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Upload URLs attached to a message, also what keeps uploads from being garbage collected
+    op.add_column('messages', sa.Column('images', sa.ARRAY(sa.String()), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'images')
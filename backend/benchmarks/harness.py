@@ -0,0 +1,172 @@
+"""Shared setup for the offline benchmarks.
+
+Importing this module points the app at the scripted "fake" LLM provider,
+so it must be imported before anything that loads config.
+"""
+import os
+
+# Must be set before config is imported
+os.environ.setdefault("MAIN_PROVIDER", "fake")
+os.environ.setdefault("FAST_PROVIDER", "fake")
+os.environ.setdefault("RUN_PERIODIC_CLEANUP", "false")
+for _key in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+    os.environ.setdefault(_key, "benchmark")
+for _key in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+    os.environ.setdefault(_key, "benchmark@localhost")
+
+import asyncio
+import hashlib
+import json
+import socket
+import statistics
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import uvicorn
+from jose import jwt
+from sqlalchemy import event
+
+from config import FAKE_LLM_TOKENS_PER_SECOND, JWT_SECRET_KEY
+from db.database import SessionLocal, engine, init_db
+from db.models import Chat, Project, Stack, Team, TeamMember, TeamRole, User, UserType
+from main import app
+from routers.project_socket import project_managers
+
+BENCH_STACK_TITLE = "Benchmark"
+BENCH_INIT_CMD = (
+    "mkdir -p /app/src && echo '<h1>benchmark</h1>' > /app/index.html"
+    " && git add -A && git commit -qm init"
+)
+BENCH_START_CMD = "python3 -m http.server ${PORT:-3000}"
+BENCH_PROMPT = "Add a small benchmark component to the app"
+
+TOKENS_PER_SECOND = FAKE_LLM_TOKENS_PER_SECOND
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def create_fixtures(projects: int, chats_per_project: int) -> Tuple[str, Dict[int, List[int]]]:
+    """Benchmark stack, user, team, projects and chats. Returns (token, {project_id: chat_ids})."""
+    init_db()
+    db = SessionLocal()
+    try:
+        stack = db.query(Stack).filter(Stack.title == BENCH_STACK_TITLE).first()
+        if stack is None:
+            stack = Stack(title=BENCH_STACK_TITLE)
+            db.add(stack)
+        stack.description = "Minimal stack used by the offline benchmarks"
+        stack.from_registry = ""
+        stack.sandbox_init_cmd = BENCH_INIT_CMD
+        stack.sandbox_start_cmd = BENCH_START_CMD
+        stack.prompt = "A static site served by python's http.server."
+        stack.pack_hash = "bench-" + hashlib.sha256(
+            f"{BENCH_INIT_CMD}{BENCH_START_CMD}".encode()
+        ).hexdigest()[:12]
+        stack.setup_time_seconds = 1
+
+        run_id = uuid.uuid4().hex[:8]
+        user = User(
+            username=f"bench-{run_id}",
+            email=f"bench-{run_id}@localhost",
+            user_type=UserType.EXPERT_DEVELOPER,
+        )
+        team = Team(name=f"Benchmark {run_id}", credits=1_000_000, created_at=datetime.now())
+        db.add_all([user, team])
+        db.flush()
+        db.add(TeamMember(team_id=team.id, user_id=user.id, role=TeamRole.ADMIN))
+
+        chat_ids: Dict[int, List[int]] = {}
+        for p in range(projects):
+            project = Project(
+                name=f"Benchmark {run_id} #{p}",
+                description="Benchmark project",
+                custom_instructions="",
+                user_id=user.id,
+                team_id=team.id,
+                stack_id=stack.id,
+                created_at=datetime.now(),
+            )
+            db.add(project)
+            db.flush()
+            chats = [
+                Chat(name=f"Benchmark chat {i}", project_id=project.id, user_id=user.id, team_id=team.id)
+                for i in range(chats_per_project)
+            ]
+            db.add_all(chats)
+            db.flush()
+            chat_ids[project.id] = [chat.id for chat in chats]
+        db.commit()
+
+        token = jwt.encode(
+            {"sub": user.username, "exp": datetime.now() + timedelta(days=1)},
+            JWT_SECRET_KEY,
+            algorithm="HS256",
+        )
+        return token, chat_ids
+    finally:
+        db.close()
+
+
+async def kill_project_managers(project_ids):
+    for project_id in project_ids:
+        if project_id in project_managers:
+            await project_managers.pop(project_id).kill()
+
+
+@asynccontextmanager
+async def serve_app():
+    """Runs the app in this event loop and yields its websocket base url."""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"ws://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await server_task
+
+
+async def wait_ready(ws, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        frame = json.loads(await asyncio.wait_for(ws.recv(), deadline - time.monotonic()))
+        if frame.get("for_type") == "status" and frame.get("sandbox_status") == "READY":
+            return
@@ -0,0 +1,362 @@
+"""Websocket load generator for concurrent streaming chats on one backend process.
+
+Opens --chats chats in each of --projects projects against
+/api/ws/chat/{chat_id}, sends prompts and records per-frame inter-arrival
+latency of streamed chunks, time to first token, reconnect churn (clients
+drop mid-turn and resume with last_seq) and the memory held by
+project_managers. The app runs in-process with the scripted "fake" LLM
+provider, so the client shares the event loop with the server: compare
+reports against each other rather than reading them as absolute numbers.
+
+    cd backend
+    python -m benchmarks.load --projects 4 --chats 8 --turns 3 --json new.json
+    python -m benchmarks.load --projects 4 --chats 8 --turns 3 --baseline old.json
+
+With --baseline the run exits non-zero if any tracked metric got worse than
+--tolerance (a fraction) compared to the baseline report.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from benchmarks.harness import (
+    BENCH_PROMPT,
+    TOKENS_PER_SECOND,
+    create_fixtures,
+    kill_project_managers,
+    serve_app,
+    summarize,
+    wait_ready,
+)
+from routers.project_socket import project_managers
+
+# Lower is better for all of these, checked against --baseline
+_TRACKED_METRICS = [
+    ("inter_arrival_ms", "p95"),
+    ("inter_arrival_ms", "p99"),
+    ("ttft_seconds", "p95"),
+    ("turn_latency_seconds", "p95"),
+    ("reconnect_ms", "p95"),
+    ("memory", "retained_mb"),
+    ("cpu_ms_per_turn", None),
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        # Peak rather than current outside of Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _manager_stats() -> Dict[str, int]:
+    managers = list(project_managers.values())
+    return {
+        "project_managers": len(managers),
+        "sockets": sum(len(s) for pm in managers for s in pm.chat_sockets.values()),
+        "agents": sum(len(pm.chat_agents) for pm in managers),
+        "replay_frames": sum(len(r.frames) for pm in managers for r in pm.chat_replays.values()),
+        "orphan_timers": sum(len(pm.orphan_timers) for pm in managers),
+        "queued_turns": sum(pm.turns.depth for pm in managers),
+    }
+
+
+class MemorySampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: List[Dict] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> Dict:
+        sample = {"rss_mb": _rss_mb(), **_manager_stats()}
+        self.samples.append(sample)
+        return sample
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def peak(self) -> Dict:
+        keys = self.samples[0].keys() if self.samples else []
+        return {key: max(s[key] for s in self.samples) for key in keys}
+
+
+class LoadStats:
+    def __init__(self):
+        self.inter_arrival: List[float] = []
+        self.ttft: List[float] = []
+        self.turn_latency: List[float] = []
+        self.reconnect: List[float] = []
+        self.frames = 0
+        self.turns = 0
+        self.failed_turns = 0
+        self.reconnects = 0
+        self.replay_gaps = 0
+        self.missed_frames = 0
+        self.duplicate_frames = 0
+
+
+class ChatClient:
+    """One browser tab: a websocket to a chat that can drop and resume with last_seq."""
+
+    def __init__(self, base_url: str, token: str, chat_id: int, stats: LoadStats):
+        self.url = f"{base_url}/api/ws/chat/{chat_id}?token={token}"
+        self.stats = stats
+        self.ws = None
+        self.last_seq = 0
+        self.reconnect_started: Optional[float] = None
+
+    async def connect(self):
+        resume = f"&last_seq={self.last_seq}" if self.last_seq else ""
+        self.ws = await websockets.connect(self.url + resume, max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    def _track_seq(self, frame: dict) -> bool:
+        """Checks ordering of numbered frames, returns whether this one is new."""
+        seq = frame.get("seq")
+        if seq is None:
+            return True
+        if seq <= self.last_seq:
+            self.stats.duplicate_frames += 1
+            return False
+        if self.last_seq and seq > self.last_seq + 1:
+            self.stats.missed_frames += seq - self.last_seq - 1
+        self.last_seq = seq
+        return True
+
+    async def _reconnect(self):
+        self.stats.reconnects += 1
+        await self.ws.close()
+        self.reconnect_started = time.monotonic()
+        await self.connect()
+
+    async def run_turn(self, timeout: float, drop_after: Optional[int]):
+        started = time.monotonic()
+        deadline = started + timeout
+        first_token = None
+        last_chunk = None
+        chunks = 0
+        await self.ws.send(json.dumps({"role": "user", "content": BENCH_PROMPT}))
+        try:
+            while True:
+                raw = await asyncio.wait_for(self.ws.recv(), deadline - time.monotonic())
+                now = time.monotonic()
+                frame = json.loads(raw)
+                self.stats.frames += 1
+                for_type = frame.get("for_type")
+                if for_type == "replay_gap":
+                    self.stats.replay_gaps += 1
+                    continue
+                if self.reconnect_started is not None and frame.get("seq") is not None:
+                    self.stats.reconnect.append(now - self.reconnect_started)
+                    self.reconnect_started = None
+                if not self._track_seq(frame):
+                    continue
+                if for_type == "chat_chunk":
+                    if first_token is None:
+                        first_token = now
+                        self.stats.ttft.append(now - started)
+                    if last_chunk is not None:
+                        self.stats.inter_arrival.append(now - last_chunk)
+                    last_chunk = now
+                    chunks += 1
+                    if drop_after is not None and chunks == drop_after:
+                        drop_after = None
+                        await self._reconnect()
+                        # The gap spanning a reconnect is churn, not delivery jitter
+                        last_chunk = None
+                elif (
+                    for_type == "chat_update"
+                    and frame["message"]["role"] == "assistant"
+                    and frame.get("follow_ups") is not None
+                ):
+                    self.stats.turn_latency.append(now - started)
+                    self.stats.turns += 1
+                    return
+        except asyncio.TimeoutError:
+            self.stats.failed_turns += 1
+
+
+async def _run_chat(
+    base_url: str, token: str, chat_id: int, args, stats: LoadStats, rng: random.Random
+):
+    client = ChatClient(base_url, token, chat_id, stats)
+    await client.connect()
+    try:
+        await wait_ready(client.ws, args.ready_timeout)
+        for _ in range(args.turns):
+            drop_after = rng.randint(1, 50) if rng.random() < args.reconnect_rate else None
+            await client.run_turn(args.turn_timeout, drop_after)
+    finally:
+        await client.close()
+
+
+async def run(args) -> Dict:
+    token, chat_ids = create_fixtures(args.projects, args.chats)
+    rng = random.Random(args.seed)
+    stats = LoadStats()
+    sampler = MemorySampler(args.sample_interval)
+
+    gc.collect()
+    baseline = sampler.sample()
+    async with serve_app() as base_url:
+        sampler.start()
+        wall_started, cpu_started = time.monotonic(), time.process_time()
+        clients = []
+        try:
+            for project_chats in chat_ids.values():
+                for chat_id in project_chats:
+                    clients.append(
+                        asyncio.create_task(_run_chat(base_url, token, chat_id, args, stats, rng))
+                    )
+                    if args.ramp:
+                        await asyncio.sleep(args.ramp / (args.projects * args.chats))
+            results = await asyncio.gather(*clients, return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            wall = time.monotonic() - wall_started
+            cpu = time.process_time() - cpu_started
+            # Sockets are closed, managers still hold their chats until they are cleaned up
+            await asyncio.sleep(0.5)
+            loaded = sampler.sample()
+        finally:
+            sampler.stop()
+            await kill_project_managers(chat_ids)
+    gc.collect()
+    cleaned = sampler.sample()
+    peak = sampler.peak()
+
+    for error in errors[:5]:
+        print(f"Chat client error: {error!r}", file=sys.stderr)
+    return {
+        "config": {
+            "projects": args.projects,
+            "chats_per_project": args.chats,
+            "turns_per_chat": args.turns,
+            "reconnect_rate": args.reconnect_rate,
+            "tokens_per_second": TOKENS_PER_SECOND,
+            "seed": args.seed,
+        },
+        "wall_seconds": wall,
+        "turns": stats.turns,
+        "failed_turns": stats.failed_turns,
+        "client_errors": len(errors),
+        "frames_per_second": stats.frames / wall if wall else 0.0,
+        "expected_inter_arrival_ms": 1000 / TOKENS_PER_SECOND if TOKENS_PER_SECOND else 0.0,
+        "inter_arrival_ms": summarize([1000 * v for v in stats.inter_arrival]),
+        "ttft_seconds": summarize(stats.ttft),
+        "turn_latency_seconds": summarize(stats.turn_latency),
+        "cpu_ms_per_turn": 1000 * cpu / stats.turns if stats.turns else 0.0,
+        "churn": {
+            "reconnects": stats.reconnects,
+            "replay_gaps": stats.replay_gaps,
+            "missed_frames": stats.missed_frames,
+            "duplicate_frames": stats.duplicate_frames,
+        },
+        "reconnect_ms": summarize([1000 * v for v in stats.reconnect]),
+        "memory": {
+            "start": baseline,
+            "peak": peak,
+            "after_load": loaded,
+            "after_cleanup": cleaned,
+            "retained_mb": cleaned["rss_mb"] - baseline["rss_mb"],
+        },
+    }
+
+
+def _metric(report: Dict, group: str, key: Optional[str]) -> float:
+    value = report.get(group, 0.0)
+    return value.get(key, 0.0) if key else value
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Prints the tracked metrics side by side and returns the ones that regressed."""
+    if report["config"] != baseline.get("config"):
+        print(f"Warning: baseline ran with a different config: {baseline.get('config')}")
+    regressions = []
+    print(f"  {'metric':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for group, key in _TRACKED_METRICS:
+        name = f"{group}.{key}" if key else group
+        old, new = _metric(baseline, group, key), _metric(report, group, key)
+        change = (new - old) / old if old else 0.0
+        print(f"  {name:<28} {old:>10.2f} {new:>10.2f} {change:>+8.1%}")
+        if old and change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def _print_report(report: Dict):
+    config = report["config"]
+    print(
+        f"{report['turns']} turns ({report['failed_turns']} timed out) over "
+        f"{config['projects']}x{config['chats_per_project']} chats in {report['wall_seconds']:.2f}s"
+    )
+    print(f"  expected inter-arrival {report['expected_inter_arrival_ms']:.2f}ms")
+    for name in ("inter_arrival_ms", "ttft_seconds", "turn_latency_seconds", "reconnect_ms"):
+        s = report[name]
+        print(
+            f"  {name:<22} p50={s['p50']:.3f} p95={s['p95']:.3f} p99={s['p99']:.3f} max={s['max']:.3f}"
+        )
+    print(f"  {'frames_per_second':<22} {report['frames_per_second']:.1f}")
+    print(f"  {'cpu_ms_per_turn':<22} {report['cpu_ms_per_turn']:.1f}")
+    print(f"  {'churn':<22} {report['churn']}")
+    memory = report["memory"]
+    print(
+        f"  {'memory':<22} start={memory['start']['rss_mb']:.1f}MB peak={memory['peak']['rss_mb']:.1f}MB "
+        f"after_cleanup={memory['after_cleanup']['rss_mb']:.1f}MB retained={memory['retained_mb']:+.1f}MB"
+    )
+    print(f"  {'after load':<22} {memory['after_load']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=2, help="Projects to spread chats over")
+    parser.add_argument("--chats", type=int, default=4, help="Concurrent chats per project")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per chat")
+    parser.add_argument("--reconnect-rate", type=float, default=0.2, help="Fraction of turns that drop and resume mid-stream")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which to open the chats")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between memory samples")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="Seconds to wait for each sandbox")
+    parser.add_argument("--turn-timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--baseline", help="Earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,17 +40,71 @@ MODAL_TOKEN_SECRET = os.getenv("MODAL_TOKEN_SECRET")
 # AI configuration
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-FAST_PROVIDER = _enum_env("FAST_PROVIDER", ["deepseek", "gemini"], default="gemini")
-MAIN_PROVIDER = _enum_env("MAIN_PROVIDER", ["deepseek", "gemini"], default="deepseek")
+FAST_PROVIDER = _enum_env("FAST_PROVIDER", ["deepseek", "gemini", "fake"], default="gemini")
+MAIN_PROVIDER = _enum_env("MAIN_PROVIDER", ["deepseek", "gemini", "fake"], default="deepseek")
 FAST_MODEL = os.getenv("FAST_MODEL", "gemini-flash-2-experimental")
 MAIN_MODEL = os.getenv("MAIN_MODEL", "deepseek-v3")
+# Offline "fake" provider: JSON script to replay (defaults to a built-in one) and its token rate
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+FAKE_LLM_TOKENS_PER_SECOND = _int_env("FAKE_LLM_TOKENS_PER_SECOND", 200)
+# Deterministic helper completions (chat names, stack picks, commit messages, follow-ups)
+COMPLETION_CACHE_MAX_ENTRIES = _int_env("COMPLETION_CACHE_MAX_ENTRIES", 1000)
+COMPLETION_CACHE_TTL_SECONDS = _int_env("COMPLETION_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)
+# Optional SQLAlchemy URL (e.g. sqlite:////tmp/promptstudio/completions.db) for a shared tier
+COMPLETION_CACHE_URL = os.getenv("COMPLETION_CACHE_URL")
+# local: derive commit messages from the change, amend: also replace them with a model-written
+# message in the background, llm: wait for the model up to COMMIT_MESSAGE_TIMEOUT_SECONDS
+COMMIT_MESSAGES = _enum_env("COMMIT_MESSAGES", ["local", "amend", "llm"], default="local")
+COMMIT_MESSAGE_TIMEOUT_SECONDS = _int_env("COMMIT_MESSAGE_TIMEOUT_SECONDS", 3)
+# Files inlined into the exec prompt, picked from a per-project BM25/exported-symbol index
+RELEVANT_FILES_TOP_K = _int_env("RELEVANT_FILES_TOP_K", 5)
+RELEVANT_FILES_TOKEN_BUDGET = _int_env("RELEVANT_FILES_TOKEN_BUDGET", 8000)
+# Size cap of the project file tree in plan and exec prompts
+FILE_TREE_TOKEN_BUDGET = _int_env("FILE_TREE_TOKEN_BUDGET", 2000)
+# Chat images are downsized to fit this many pixels per side and re-encoded at this quality
+IMAGE_MAX_DIMENSION = _int_env("IMAGE_MAX_DIMENSION", 1568)
+IMAGE_QUALITY = _int_env("IMAGE_QUALITY", 80)
+# Larger images are rejected before decoding; ample for screenshots and phone photos
+IMAGE_MAX_PIXELS = _int_env("IMAGE_MAX_PIXELS", 50_000_000)
+# In-memory cache of the base64 image payloads sent to models
+IMAGE_CACHE_MAX_BYTES = _int_env("IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
 
 # Misc configuration
 RUN_PERIODIC_CLEANUP = _bool_env("RUN_PERIODIC_CLEANUP", default=True)
 RUN_STACK_SYNC_ON_START = _bool_env("RUN_STACK_SYNC_ON_START", default=True)
 PROJECTS_SET_NEVER_CLEANUP = _bool_env("PROJECTS_SET_NEVER_CLEANUP", default=False)
 TARGET_PREPARED_SANDBOXES_PER_STACK = _int_env("TARGET_PREPARED_SANDBOXES_PER_STACK", 3)
+MIN_PREPARED_SANDBOXES_PER_STACK = _int_env("MIN_PREPARED_SANDBOXES_PER_STACK", 1)
+PREPARED_POOL_BUILD_CONCURRENCY = _int_env("PREPARED_POOL_BUILD_CONCURRENCY", 2)
+PREPARED_POOL_DEMAND_WINDOW_MINUTES = _int_env("PREPARED_POOL_DEMAND_WINDOW_MINUTES", 60)
+PREPARED_POOL_LOOKAHEAD_MINUTES = _int_env("PREPARED_POOL_LOOKAHEAD_MINUTES", 10)
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+PREVIEW_BASE_URL = os.getenv("PREVIEW_BASE_URL", "http://localhost:8000")
+# Lifetime of the signed preview URLs handed to clients
+PREVIEW_TOKEN_HOURS = _int_env("PREVIEW_TOKEN_HOURS", 24)
+SANDBOX_HIBERNATE_MINUTES = _int_env("SANDBOX_HIBERNATE_MINUTES", 5)
+DEV_SERVER_PORT_START = _int_env("DEV_SERVER_PORT_START", 20000)
+DEV_SERVER_PORT_END = _int_env("DEV_SERVER_PORT_END", 21000)
+DEV_SERVER_LOG_LINES = _int_env("DEV_SERVER_LOG_LINES", 500)
+DEV_SERVER_READY_TIMEOUT_SECONDS = _int_env("DEV_SERVER_READY_TIMEOUT_SECONDS", 120)
+EXPORT_CACHE_MAX_BYTES = _int_env("EXPORT_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+EXPORT_WATCH_MINUTES = _int_env("EXPORT_WATCH_MINUTES", 15)
+CHAT_ORPHAN_CANCEL_SECONDS = _int_env("CHAT_ORPHAN_CANCEL_SECONDS", 30)
+CHAT_REPLAY_MAX_FRAMES = _int_env("CHAT_REPLAY_MAX_FRAMES", 5000)
+# Run project managers across several workers, coordinated through Postgres
+MULTI_WORKER = _bool_env("MULTI_WORKER", default=False)
+PROJECT_LEASE_SECONDS = _int_env("PROJECT_LEASE_SECONDS", 30)
+# When set, /metrics requires an "Authorization: Bearer <token>" header
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Per-turn trace spans in OTLP JSON, appended to a file (one trace per line) and/or
+# posted to an OTLP/HTTP collector (e.g. http://localhost:4318)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", "/app/uploads")
+UPLOAD_MAX_BYTES = _int_env("UPLOAD_MAX_BYTES", 20 * 1024 * 1024)
+# Uploads no chat message references are deleted once older than this
+UPLOAD_GC_GRACE_HOURS = _int_env("UPLOAD_GC_GRACE_HOURS", 24)
+UPLOAD_GC_INTERVAL_MINUTES = _int_env("UPLOAD_GC_INTERVAL_MINUTES", 60)
 
 # Credits configuration
 CREDITS_DEFAULT = _int_env("CREDITS_DEFAULT", 20)
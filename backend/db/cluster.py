@@ -0,0 +1,274 @@
+import json
+import uuid
+import asyncio
+import datetime
+import traceback
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from config import PROJECT_LEASE_SECONDS
+from db.database import engine
+from db.models import ProjectLease
+
+# Identifies this process in the lease table
+WORKER_ID = str(uuid.uuid4())
+
+# NOTIFY payloads must stay under 8000 bytes, larger messages are split
+_MAX_PAYLOAD_CHARS = 7000
+# Notifications sent per round trip when publishes pile up
+_MAX_BATCH_NOTIFIES = 100
+
+
+def _lease_expiry():
+    return func.localtimestamp() + datetime.timedelta(seconds=PROJECT_LEASE_SECONDS)
+
+
+class ProjectLeases:
+    """Records which worker runs each project's manager. Leases expire unless renewed."""
+
+    def acquire(self, db: Session, project_id: int) -> bool:
+        """Take the project's lease if it is free, expired or already ours."""
+        stmt = (
+            insert(ProjectLease)
+            .values(project_id=project_id, owner_id=WORKER_ID, expires_at=_lease_expiry())
+            .on_conflict_do_update(
+                index_elements=[ProjectLease.project_id],
+                set_={"owner_id": WORKER_ID, "expires_at": _lease_expiry()},
+                where=(ProjectLease.expires_at < func.localtimestamp())
+                | (ProjectLease.owner_id == WORKER_ID),
+            )
+            .returning(ProjectLease.owner_id)
+        )
+        row = db.execute(stmt).first()
+        db.commit()
+        return row is not None
+
+    def renew(self, db: Session, project_ids: List[int]) -> Set[int]:
+        """Extend our leases, returning the projects whose lease we no longer hold."""
+        if not project_ids:
+            return set()
+        renewed = (
+            db.query(ProjectLease)
+            .filter(
+                ProjectLease.project_id.in_(project_ids),
+                ProjectLease.owner_id == WORKER_ID,
+            )
+            .update({"expires_at": _lease_expiry()}, synchronize_session=False)
+        )
+        db.commit()
+        if renewed == len(project_ids):
+            return set()
+        held = {
+            lease.project_id
+            for lease in db.query(ProjectLease).filter(
+                ProjectLease.project_id.in_(project_ids),
+                ProjectLease.owner_id == WORKER_ID,
+            )
+        }
+        return set(project_ids) - held
+
+    def is_held(self, db: Session, project_id: int) -> bool:
+        """Whether some live worker holds the project's lease."""
+        return (
+            db.query(ProjectLease)
+            .filter(
+                ProjectLease.project_id == project_id,
+                ProjectLease.expires_at >= func.localtimestamp(),
+            )
+            .first()
+            is not None
+        )
+
+    def set_preview_port(self, db: Session, project_id: int, port: int):
+        db.query(ProjectLease).filter(
+            ProjectLease.project_id == project_id,
+            ProjectLease.owner_id == WORKER_ID,
+        ).update({"preview_port": port}, synchronize_session=False)
+        db.commit()
+
+    def get_preview_port(self, db: Session, project_id: int) -> Optional[int]:
+        """Dev server port of a project run by another live worker on this host."""
+        lease = (
+            db.query(ProjectLease)
+            .filter(
+                ProjectLease.project_id == project_id,
+                ProjectLease.owner_id != WORKER_ID,
+                ProjectLease.expires_at >= func.localtimestamp(),
+            )
+            .first()
+        )
+        return lease and lease.preview_port
+
+    def release(self, db: Session, project_id: int):
+        db.query(ProjectLease).filter(
+            ProjectLease.project_id == project_id,
+            ProjectLease.owner_id == WORKER_ID,
+        ).delete(synchronize_session=False)
+        db.commit()
+
+
+def _autocommit_connection():
+    conn = psycopg2.connect(
+        **engine.url.translate_connect_args(username="user", database="dbname")
+    )
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+class ProjectBus:
+    """Delivers JSON messages between workers over Postgres LISTEN/NOTIFY.
+
+    Messages on a channel are handled one at a time, in the order they were published.
+    Publishing never blocks the event loop: notifications are queued and sent in
+    batches from a thread, over a connection of their own.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._publish_conn = None
+        self._outbox: List[Tuple[str, str]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._consumers: Dict[str, asyncio.Task] = {}
+        self._parts: Dict[str, List[Optional[str]]] = defaultdict(list)
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        conn = _autocommit_connection()
+        with conn.cursor() as cursor:
+            for channel in self._handlers:
+                cursor.execute(f'LISTEN "{channel}"')
+        asyncio.get_running_loop().add_reader(conn.fileno(), self._on_readable)
+        self._conn = conn
+        return conn
+
+    def _reset(self):
+        if self._conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._conn.fileno())
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def ensure_connected(self):
+        """Reconnect (and re-LISTEN) after the connection dropped."""
+        try:
+            self._connect()
+        except psycopg2.Error as e:
+            print(f"Project bus connection failed: {e}")
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            print(f"Project bus connection lost: {e}")
+            self._reset()
+            return
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            self._receive(notify.channel, notify.payload)
+
+    def _receive(self, channel: str, payload: str):
+        message_id, index, count, data = payload.split(":", 3)
+        index, count = int(index), int(count)
+        if count > 1:
+            parts = self._parts[message_id]
+            if not parts:
+                parts.extend([None] * count)
+            parts[index] = data
+            if any(part is None for part in parts):
+                return
+            data = "".join(self._parts.pop(message_id))
+        queue = self._queues.get(channel)
+        if queue is not None:
+            queue.put_nowait(json.loads(data))
+
+    async def _consume(self, channel: str, queue: asyncio.Queue):
+        while True:
+            message = await queue.get()
+            handler = self._handlers.get(channel)
+            if handler is None:
+                continue
+            try:
+                await handler(message)
+            except Exception as e:
+                print(f"Error handling {channel} message: {e}\n{traceback.format_exc()}")
+
+    def subscribe(self, channel: str, handler: Callable[[dict], Awaitable[None]]):
+        self._handlers[channel] = handler
+        if channel not in self._queues:
+            queue = asyncio.Queue()
+            self._queues[channel] = queue
+            self._consumers[channel] = asyncio.create_task(self._consume(channel, queue))
+        with self._connect().cursor() as cursor:
+            cursor.execute(f'LISTEN "{channel}"')
+
+    def unsubscribe(self, channel: str):
+        self._handlers.pop(channel, None)
+        self._queues.pop(channel, None)
+        consumer = self._consumers.pop(channel, None)
+        if consumer is not None:
+            consumer.cancel()
+        if self._conn is not None:
+            with self._conn.cursor() as cursor:
+                cursor.execute(f'UNLISTEN "{channel}"')
+
+    def publish(self, channel: str, message: dict):
+        data = json.dumps(message)
+        chunks = [
+            data[i : i + _MAX_PAYLOAD_CHARS]
+            for i in range(0, len(data), _MAX_PAYLOAD_CHARS)
+        ] or [""]
+        message_id = uuid.uuid4().hex
+        for index, chunk in enumerate(chunks):
+            self._outbox.append((channel, f"{message_id}:{index}:{len(chunks)}:{chunk}"))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # A single flusher keeps notifications in publish order
+        while self._outbox:
+            batch = self._outbox[:_MAX_BATCH_NOTIFIES]
+            del self._outbox[:_MAX_BATCH_NOTIFIES]
+            try:
+                await asyncio.to_thread(self._send, batch)
+            except psycopg2.Error as e:
+                print(f"Project bus dropped {len(batch)} notifications: {e}")
+
+    def _send(self, batch: List[Tuple[str, str]]):
+        """Runs in a thread, one batch at a time."""
+        for attempt in range(2):
+            try:
+                if self._publish_conn is None:
+                    self._publish_conn = _autocommit_connection()
+                with self._publish_conn.cursor() as cursor:
+                    # One round trip; statements in one string run in order
+                    cursor.execute(
+                        "SELECT pg_notify(%s, %s);" * len(batch),
+                        [value for notify in batch for value in notify],
+                    )
+                return
+            except psycopg2.Error:
+                if self._publish_conn is not None:
+                    try:
+                        self._publish_conn.close()
+                    except psycopg2.Error:
+                        pass
+                    self._publish_conn = None
+                # Retry once on a fresh connection in case this one had gone stale
+                if attempt:
+                    raise
+
+
+project_leases = ProjectLeases()
+project_bus = ProjectBus()
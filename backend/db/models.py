@@ -1,5 +1,5 @@
 from enum import Enum
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import ARRAY, Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Boolean, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -110,11 +110,48 @@ class PreparedSandbox(Base):
     stack_id = Column(Integer, ForeignKey("stacks.id"))
     stack = relationship("Stack", back_populates="prepared_sandboxes")
 
+class ProjectLease(Base):
+    __tablename__ = "project_leases"
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    owner_id = Column(String)
+    expires_at = Column(DateTime)
+    preview_port = Column(Integer, nullable=True)
+
+class TurnUsage(Base):
+    __tablename__ = "turn_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime)
+    team_id = Column(Integer, ForeignKey("teams.id"), index=True)
+    # No foreign keys so usage history outlives deleted projects and chats
+    project_id = Column(Integer, nullable=True, index=True)
+    chat_id = Column(Integer, nullable=True)
+    trace_id = Column(String, nullable=True)
+    phase = Column(String)
+    provider = Column(String)
+    model = Column(String)
+    calls = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"
+    team_id = Column(Integer, ForeignKey("teams.id"), primary_key=True)
+    # 0 for usage outside a project (e.g. naming a new chat's project)
+    project_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    phase = Column(String, primary_key=True)
+    calls = Column(BigInteger, default=0)
+    prompt_tokens = Column(BigInteger, default=0)
+    completion_tokens = Column(BigInteger, default=0)
+    cached_tokens = Column(BigInteger, default=0)
+
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True, index=True)
     role = Column(String)
     content = Column(Text)
+    images = Column(ARRAY(String), nullable=True)
     created_at = Column(DateTime)
     chat_id = Column(Integer, ForeignKey("chats.id"))
     chat = relationship("Chat", back_populates="messages")
\ No newline at end of file
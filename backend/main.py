@@ -1,9 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from db.database import init_db, get_db
 from contextlib import asynccontextmanager
 import asyncio
+import time
 
 from routers import (
     project_socket,
@@ -14,14 +15,20 @@ from routers import (
     chats,
     uploads,
     mocks,
+    preview,
+    metrics,
     # stripe,
 )
-from config import RUN_PERIODIC_CLEANUP
+from config import MULTI_WORKER, PROJECT_LEASE_SECONDS, RUN_PERIODIC_CLEANUP
+from telemetry.metrics import HTTP_REQUEST_DB_QUERIES, HTTP_REQUEST_DURATION, count_queries
 
 from tasks.tasks import (
     cleanup_inactive_project_managers,
+    hibernate_idle_sandboxes,
+    renew_project_leases,
     maintain_prepared_sandboxes,
     clean_up_project_resources,
+    collect_upload_garbage,
 )
 
 
@@ -34,16 +41,39 @@ async def periodic_task():
             maintain_prepared_sandboxes(db),
             clean_up_project_resources(db),
             cleanup_inactive_project_managers(),
+            collect_upload_garbage(),
         )
         await asyncio.sleep(10)
 
 
+async def hibernation_task():
+    # Dev servers are this worker's own processes, so this runs even with cleanup disabled
+    while True:
+        await hibernate_idle_sandboxes()
+        await asyncio.sleep(30)
+
+
+async def lease_renewal_task():
+    # Own loop and session: a lease must never lapse because cleanup is off or slow
+    if not MULTI_WORKER:
+        return
+    db = next(get_db())
+    while True:
+        await renew_project_leases(db)
+        await asyncio.sleep(PROJECT_LEASE_SECONDS / 3)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()  # Initialize database and sync stacks
-    task = asyncio.create_task(periodic_task())
+    tasks = [
+        asyncio.create_task(periodic_task()),
+        asyncio.create_task(hibernation_task()),
+        asyncio.create_task(lease_renewal_task()),
+    ]
     yield
-    task.cancel()
+    for task in tasks:
+        task.cancel()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -64,6 +94,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    with count_queries() as queries:
+        response = await call_next(request)
+    # Route templates rather than raw paths keep label cardinality bounded
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    HTTP_REQUEST_DURATION.labels(
+        method=request.method, route=path, status=response.status_code
+    ).observe(time.perf_counter() - started)
+    HTTP_REQUEST_DB_QUERIES.labels(method=request.method, route=path).observe(queries[0])
+    return response
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(projects.router)
@@ -73,6 +119,8 @@ app.include_router(teams.router)
 app.include_router(chats.router)
 app.include_router(uploads.router)
 app.include_router(mocks.router)
+app.include_router(preview.router)
+app.include_router(metrics.router)
 # app.include_router(stripe.router)
 
 if __name__ == "__main__":
@@ -68,6 +68,12 @@ async def get_current_user_from_token(
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
 
 
+async def require_admin(current_user: User = Depends(get_current_user_from_token)) -> User:
+    if current_user.user_type != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
 @router.post("/create", response_model=AuthResponse)
 async def create_user(user: UserCreate, db: Session = Depends(get_db)):
     # Check if email is already taken
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List
 from sqlalchemy.orm import joinedload
 import secrets
 
@@ -8,10 +8,13 @@ from db.database import get_db
 from db.models import User, Chat, Team, Project, Stack, TeamMember
 from db.queries import get_chat_for_user
 from agents.prompts import name_chat, pick_stack
+from agents.cache import completion_cache
+from agents.usage import save_usage, track_usage
 from sandbox.sandbox import DevSandbox
+from sandbox.tunnels import PREVIEW_PORT
 from config import CREDITS_CHAT_COST, PROJECTS_SET_NEVER_CLEANUP
 from schemas.models import ChatCreate, ChatUpdate, ChatResponse, PreviewUrlResponse
-from routers.auth import get_current_user_from_token
+from routers.auth import get_current_user_from_token, require_admin
 
 router = APIRouter(prefix="/api/chats", tags=["chats"])
 
@@ -31,6 +34,14 @@ async def get_user_chats(
     )
 
 
+@router.get("/completion-cache-stats", response_model=Dict[str, float])
+async def get_completion_cache_stats(_: User = Depends(require_admin)):
+    """
+    Get hit/miss counts for cached helper prompt completions.
+    """
+    return completion_cache.stats()
+
+
 @router.get("/{chat_id}", response_model=ChatResponse)
 async def get_chat(
     chat_id: int,
@@ -88,14 +99,15 @@ async def create_chat(
         raise HTTPException(status_code=404, detail="Team not found")
     team_id = team.id
 
-    if chat.stack_id is None:
-        stack = await _pick_stack(db, chat.seed_prompt)
-    else:
-        stack = db.query(Stack).filter(Stack.id == chat.stack_id).first()
-        if stack is None:
-            raise HTTPException(status_code=404, detail="Stack not found")
+    with track_usage() as usage:
+        if chat.stack_id is None:
+            stack = await _pick_stack(db, chat.seed_prompt)
+        else:
+            stack = db.query(Stack).filter(Stack.id == chat.stack_id).first()
+            if stack is None:
+                raise HTTPException(status_code=404, detail="Stack not found")
 
-    project_name, project_description, chat_name = await name_chat(chat.seed_prompt)
+        project_name, project_description, chat_name = await name_chat(chat.seed_prompt)
 
     if chat.project_id is None:
         project = Project(
@@ -147,6 +159,7 @@ async def create_chat(
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+    save_usage(db, usage, team_id, project_id, new_chat.id)
     return new_chat
 
 
@@ -274,8 +287,9 @@ async def get_public_chat_preview_url(
         raise HTTPException(status_code=404, detail="Chat or project not found")
 
     sandbox = await DevSandbox.get_or_create(chat.project.id, create_if_missing=True)
-    await sandbox.wait_for_up()
-    tunnels = await sandbox.sb.tunnels.aio()
-    preview_url = tunnels[3000].url
+    # The preview proxy holds requests until the dev server is listening
+    await sandbox.start_dev_server()
+    tunnels = await sandbox.get_tunnels()
+    preview_url = tunnels[PREVIEW_PORT]
 
     return {"preview_url": preview_url}
\ No newline at end of file
@@ -0,0 +1,17 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+from config import METRICS_TOKEN
+
+router = APIRouter(tags=["metrics"])
+
+
+# Sync so scrape-time collectors that hit the database run in the threadpool
+@router.get("/metrics")
+def get_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,193 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import httpx
+import websockets
+from sqlalchemy.orm import Session
+
+from sandbox.sandbox import DevSandbox, SandboxNotReadyException
+from sandbox.lifecycle import lifecycle_manager
+from sandbox.tunnels import (
+    PREVIEW_TOKEN_SEGMENT,
+    tunnel_registry,
+    preview_path,
+    verify_preview_token,
+)
+from db.database import get_db
+from db.cluster import project_leases
+from config import DEV_SERVER_READY_TIMEOUT_SECONDS, MULTI_WORKER, PREVIEW_BASE_URL
+
+router = APIRouter(tags=["preview"])
+
+# Shared client so connections to each dev server are kept alive between requests
+_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200),
+)
+
+_HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+}
+
+
+PREVIEW_COOKIE = "preview_token"
+# Cross-site iframes only send cookies marked SameSite=None, which browsers require be Secure
+_SECURE_COOKIE = PREVIEW_BASE_URL.startswith("https://")
+
+
+def _filter_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS}
+
+
+def _authorize(project_id: int, cookies):
+    """Raises 404 without a valid preview cookie, so project ids can't be probed."""
+    if verify_preview_token(project_id, cookies.get(PREVIEW_COOKIE)) is None:
+        raise HTTPException(status_code=404, detail="Preview not found")
+
+
+def _redeem_token(request: Request, project_id: int, path: str) -> RedirectResponse:
+    """Trade the token in a signed preview URL for a cookie scoped to the project's
+    previews, then redirect to the page so its relative asset URLs resolve."""
+    _, _, rest = path.partition("/")
+    token, _, page = rest.partition("/")
+    expires = verify_preview_token(project_id, token)
+    if expires is None:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    url = preview_path(project_id) + page.lstrip("/")
+    if request.url.query:
+        url += f"?{request.url.query}"
+    response = RedirectResponse(url, status_code=302)
+    response.set_cookie(
+        PREVIEW_COOKIE,
+        token,
+        expires=expires,
+        path=preview_path(project_id),
+        httponly=True,
+        secure=_SECURE_COOKIE,
+        samesite="none" if _SECURE_COOKIE else "lax",
+    )
+    return response
+
+
+async def _get_preview_port(db: Session, project_id: int) -> int:
+    """Port of the project's dev server, resuming it if needed. Only call once authorized."""
+    server = tunnel_registry.get_server(project_id)
+    if server is None and MULTI_WORKER:
+        # The project's manager may live in another worker on this host
+        port = project_leases.get_preview_port(db, project_id)
+        if port is not None:
+            return port
+    if server is None:
+        # Nobody has the project open (or it hibernated), start it on demand
+        try:
+            sandbox = await DevSandbox.get_or_create(project_id, create_if_missing=False)
+        except SandboxNotReadyException:
+            raise HTTPException(status_code=404, detail="Preview not found")
+        await sandbox.start_dev_server()
+        server = tunnel_registry.get_server(project_id)
+    # Returns immediately once the dev server's port has been seen open
+    if server is None or not await server.wait_for_up(DEV_SERVER_READY_TIMEOUT_SECONDS):
+        raise HTTPException(status_code=503, detail="Preview is not running")
+    lifecycle_manager.touch(server.sandbox_id)
+    return server.port
+
+
+@router.api_route(
+    "/preview/{project_id}/{path:path}",
+    methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"],
+)
+async def proxy_preview(
+    request: Request, project_id: int, path: str, db: Session = Depends(get_db)
+):
+    if path == PREVIEW_TOKEN_SEGMENT or path.startswith(f"{PREVIEW_TOKEN_SEGMENT}/"):
+        return _redeem_token(request, project_id, path)
+    _authorize(project_id, request.cookies)
+    port = await _get_preview_port(db, project_id)
+    upstream_request = _client.build_request(
+        request.method,
+        f"http://127.0.0.1:{port}{request.url.path}",
+        params=request.query_params,
+        headers=_filter_headers(request.headers),
+        content=request.stream(),
+    )
+    try:
+        upstream = await _client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Preview unavailable: {e}")
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers=_filter_headers(upstream.headers),
+        background=BackgroundTask(upstream.aclose),
+    )
+
+
+@router.websocket("/preview/{project_id}/{path:path}")
+async def proxy_preview_websocket(
+    websocket: WebSocket, project_id: int, path: str, db: Session = Depends(get_db)
+):
+    try:
+        _authorize(project_id, websocket.cookies)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    try:
+        port = await _get_preview_port(db, project_id)
+    except HTTPException:
+        await websocket.close(code=1011)
+        return
+
+    url = f"ws://127.0.0.1:{port}{websocket.url.path}"
+    if websocket.url.query:
+        url += f"?{websocket.url.query}"
+    subprotocols = [
+        p.strip()
+        for p in websocket.headers.get("sec-websocket-protocol", "").split(",")
+        if p.strip()
+    ]
+
+    try:
+        async with websockets.connect(url, subprotocols=subprotocols or None) as upstream:
+            await websocket.accept(subprotocol=upstream.subprotocol)
+
+            async def _client_to_upstream():
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    await upstream.send(
+                        message["text"] if message.get("text") is not None else message["bytes"]
+                    )
+
+            async def _upstream_to_client():
+                async for message in upstream:
+                    if isinstance(message, bytes):
+                        await websocket.send_bytes(message)
+                    else:
+                        await websocket.send_text(message)
+
+            tasks = [
+                asyncio.create_task(_client_to_upstream()),
+                asyncio.create_task(_upstream_to_client()),
+            ]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        print(f"Preview websocket proxy error for project {project_id}: {e}")
+    try:
+        await websocket.close()
+    except Exception:
+        pass
@@ -1,20 +1,40 @@
 from fastapi import APIRouter, WebSocket, WebSocketException, WebSocketDisconnect
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from collections import deque
 from enum import Enum
 from asyncio import create_task, Lock
 from pydantic import BaseModel
 import datetime
 import asyncio
+import difflib
+import json
+import re
+import time
+import uuid
 import traceback
 
 from sandbox.sandbox import DevSandbox, SandboxNotReadyException
+from sandbox.exports import export_cache
+from sandbox.lifecycle import lifecycle_manager
 from agents.agent import Agent, ChatMessage
 from agents.diff import parse_file_changes
+from agents.retrieval import FileIndex
 from db.database import get_db
 from db.models import Project, Message as DbChatMessage, Stack, User, Chat
 from db.queries import get_chat_for_user
-from agents.prompts import write_commit_message
+from agents.prompts import write_commit_message, local_commit_message
+from agents.usage import UsageTracker, save_usage, track_usage
 from routers.auth import get_current_user_from_token
+from db.cluster import project_bus, project_leases
+from telemetry.metrics import ACTIVE_WEBSOCKETS, FILE_APPLY_DURATION, PROJECT_MANAGERS
+from telemetry.tracing import span
+from config import (
+    CHAT_ORPHAN_CANCEL_SECONDS,
+    CHAT_REPLAY_MAX_FRAMES,
+    COMMIT_MESSAGES,
+    COMMIT_MESSAGE_TIMEOUT_SECONDS,
+    MULTI_WORKER,
+)
 from sqlalchemy.orm import Session
 
 
@@ -42,6 +62,9 @@ class ChatUpdateResponse(BaseModel):
     message: ChatMessage
     follow_ups: Optional[List[str]] = None
     navigate_to: Optional[str] = None
+    seq: Optional[int] = None
+    # Trace of the turn that produced this message, for tying reports to its spans
+    trace_id: Optional[str] = None
 
 
 class ChatChunkResponse(BaseModel):
@@ -49,6 +72,19 @@ class ChatChunkResponse(BaseModel):
     role: str
     content: str
     thinking_content: str
+    seq: Optional[int] = None
+
+
+class ReplayGapResponse(BaseModel):
+    for_type: str = "replay_gap"
+    chat_id: int
+
+
+class QueueStatusResponse(BaseModel):
+    for_type: str = "queue"
+    depth: int
+    running_chat_ids: List[int]
+    pending_chat_ids: List[int]
 
 
 def _message_to_db_message(message: ChatMessage, chat_id: int) -> DbChatMessage:
@@ -71,15 +107,240 @@ def _db_message_to_message(db_message: DbChatMessage) -> ChatMessage:
 
 router = APIRouter(tags=["websockets"])
 
+_RETRY_MIN_SECONDS = 0.05
+_RETRY_MAX_SECONDS = 30.0
+_SANDBOX_WAIT_SECONDS = 10.0
+
+_READ_ONLY_PREFIXES = (
+    "what", "why", "how", "where", "which", "who", "when",
+    "explain", "describe", "does", "is ", "are ", "can you explain",
+)
+_WRITE_HINTS = re.compile(
+    r"\b(add|change|make|fix|create|update|remove|delete|build|implement|replace|"
+    r"rename|install|refactor|move|style|edit|write|set up|convert|use)\b",
+    re.IGNORECASE,
+)
+
+
+def _is_read_only_turn(message: ChatMessage) -> bool:
+    """Conservatively guess whether a turn is a question that won't touch files."""
+    text = message.content.strip().lower()
+    if message.images or not text:
+        return False
+    if not (text.endswith("?") or text.startswith(_READ_ONLY_PREFIXES)):
+        return False
+    return _WRITE_HINTS.search(text) is None
+
+
+class ReplayBuffer:
+    """Numbered chat frames of a chat's latest turn, for clients that reconnect mid-turn."""
+
+    def __init__(self, max_frames: int):
+        self.next_seq = 1
+        self.frames: Deque[tuple] = deque(maxlen=max_frames)
+
+    def start_turn(self):
+        self.frames.clear()
+
+    def record(self, data: BaseModel) -> dict:
+        data.seq = self.next_seq
+        self.next_seq += 1
+        frame = data.model_dump()
+        self.frames.append((data.seq, frame))
+        return frame
+
+    def since(self, last_seq: int) -> Optional[List[tuple]]:
+        """Frames after last_seq, or None if some of them are no longer buffered."""
+        if last_seq >= self.next_seq:
+            # Numbered by a previous manager for this project
+            return None
+        first_seq = self.frames[0][0] if self.frames else self.next_seq
+        if last_seq < first_seq - 1:
+            return None
+        return [(seq, frame) for seq, frame in self.frames if seq > last_seq]
+
+
+class ChatTurn:
+    def __init__(self, chat_id: int, message: ChatMessage, read_only: bool):
+        self.chat_id = chat_id
+        self.message = message
+        self.read_only = read_only
+        self.trace_id: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class TurnQueue:
+    """FIFO of chat turns for one project.
+
+    A turn that may edit files runs alone; consecutive read-only turns run
+    together. Turns never overtake each other, and each chat runs one turn at a time.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[ChatTurn], Awaitable[None]],
+        on_change: Callable[[], Awaitable[None]],
+    ):
+        self._run = run
+        self._on_change = on_change
+        self.pending: Deque[ChatTurn] = deque()
+        self.running: List[ChatTurn] = []
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending) + len(self.running)
+
+    def _can_start(self, turn: ChatTurn) -> bool:
+        if not self.running:
+            return True
+        if not turn.read_only:
+            return False
+        return all(t.read_only and t.chat_id != turn.chat_id for t in self.running)
+
+    def _schedule(self):
+        while self.pending and self._can_start(self.pending[0]):
+            turn = self.pending.popleft()
+            self.running.append(turn)
+            turn.task = create_task(self._run(turn))
+            # A callback rather than a finally: a task cancelled before it first runs
+            # never executes its coroutine, but still completes
+            turn.task.add_done_callback(lambda _, turn=turn: self._on_turn_done(turn))
+
+    def _on_turn_done(self, turn: ChatTurn):
+        self.running.remove(turn)
+        self._schedule()
+        create_task(self._on_change())
+
+    def submit(self, turn: ChatTurn):
+        self.pending.append(turn)
+        self._schedule()
+
+    def cancel_chat(self, chat_id: int) -> bool:
+        """Drop the chat's queued turns and cancel its running one."""
+        cancelled = False
+        for turn in [t for t in self.pending if t.chat_id == chat_id]:
+            self.pending.remove(turn)
+            cancelled = True
+        for turn in self.running:
+            if turn.chat_id == chat_id and turn.task is not None:
+                turn.task.cancel()
+                cancelled = True
+        return cancelled
+
+    def is_busy(self, other_than: Optional[ChatTurn] = None) -> bool:
+        return any(t is not other_than for t in self.running)
+
+    def status(self) -> QueueStatusResponse:
+        return QueueStatusResponse(
+            depth=self.depth,
+            running_chat_ids=[t.chat_id for t in self.running],
+            pending_chat_ids=[t.chat_id for t in self.pending],
+        )
 
-async def _apply_file_changes(agent: Agent, total_content: str):
-    if agent.sandbox:
-        changes = await parse_file_changes(agent.sandbox, total_content)
-        if len(changes) > 0:
+
+def _inbox_channel(project_id: int) -> str:
+    return f"project_{project_id}_in"
+
+
+def _outbox_channel(project_id: int) -> str:
+    return f"project_{project_id}_out"
+
+
+class RemoteSocket:
+    """Stands in for a websocket accepted by another worker, sending over the project bus."""
+
+    def __init__(self, project_id: int, socket_id: str):
+        self.project_id = project_id
+        self.socket_id = socket_id
+
+    async def send_json(self, data: dict):
+        project_bus.publish(
+            _outbox_channel(self.project_id), {"socket_id": self.socket_id, "data": data}
+        )
+
+    async def close(self):
+        project_bus.publish(
+            _outbox_channel(self.project_id), {"socket_id": self.socket_id, "close": True}
+        )
+
+
+async def _file_stats(sandbox: DevSandbox, changes) -> List[tuple]:
+    stats = []
+    for change in changes:
+        old = await sandbox.read_file_contents(change.path, does_not_exist_ok=True)
+        added = removed = 0
+        for line in difflib.unified_diff(old.splitlines(), change.content.splitlines(), n=0):
+            if line.startswith("+") and not line.startswith("+++"):
+                added += 1
+            elif line.startswith("-") and not line.startswith("---"):
+                removed += 1
+        stats.append((change.path, added, removed, old == ""))
+    return stats
+
+
+async def _commit_message(total_content: str, prompt: str, file_stats: List[tuple]) -> str:
+    if COMMIT_MESSAGES == "llm":
+        try:
+            return await asyncio.wait_for(
+                write_commit_message(total_content), COMMIT_MESSAGE_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            print(f"Falling back to local commit message: {e!r}")
+    return local_commit_message(prompt, file_stats)
+
+
+async def _amend_commit_message(
+    sandbox: DevSandbox,
+    sha: str,
+    total_content: str,
+    lock: Lock,
+    save_turn_usage: Callable[[UsageTracker], None],
+):
+    # Runs after the turn's usage was saved, so it saves its own
+    with track_usage() as usage:
+        try:
             commit_message = await write_commit_message(total_content)
+            if not commit_message.strip():
+                return
+            async with lock:
+                amended = await sandbox.amend_commit_message(sha, commit_message)
+            if amended:
+                await export_cache.prebuild(sandbox)
+        except Exception as e:
+            print(f"Failed to amend commit message: {e}\n{traceback.format_exc()}")
+        finally:
+            save_turn_usage(usage)
+
+
+async def _apply_file_changes(
+    agent: Agent,
+    total_content: str,
+    prompt: str,
+    lock: Lock,
+    save_turn_usage: Callable[[UsageTracker], None],
+):
+    if agent.sandbox:
+        started = time.perf_counter()
+        # Turns guessed read-only run concurrently and may still edit files, so changes
+        # are resolved, written and committed under one lock, never against stale files
+        async with lock:
+            changes = await parse_file_changes(agent.sandbox, total_content)
+            if not changes:
+                return
+            file_stats = await _file_stats(agent.sandbox, changes)
+            commit_message = await _commit_message(total_content, prompt, file_stats)
             print("Applying Changes", [f.path for f in changes], repr(commit_message))
-            await agent.sandbox.write_file_contents_and_commit(
-                [(change.path, change.content) for change in changes], commit_message
+            with span("sandbox.write_file_contents_and_commit", files=len(changes)):
+                await agent.sandbox.write_file_contents_and_commit(
+                    [(change.path, change.content) for change in changes], commit_message
+                )
+            sha = await agent.sandbox.get_head_sha()
+        await export_cache.prebuild(agent.sandbox)
+        FILE_APPLY_DURATION.observe(time.perf_counter() - started)
+        if COMMIT_MESSAGES == "amend" and sha:
+            # The commit has landed, the model's message replaces ours when it's ready
+            create_task(
+                _amend_commit_message(agent.sandbox, sha, total_content, lock, save_turn_usage)
             )
 
 
@@ -90,12 +351,18 @@ class ProjectManager:
         self.chat_sockets: Dict[int, List[WebSocket]] = {}
         self.chat_agents: Dict[int, Agent] = {}
         self.chat_users: Dict[int, User] = {}
-        self.lock: Lock = Lock()
+        self.turns = TurnQueue(self._try_handle_chat_message, self.emit_queue_status)
+        self.apply_lock: Lock = Lock()
+        self.orphan_timers: Dict[int, asyncio.Task] = {}
+        self.remote_sockets: Dict[str, RemoteSocket] = {}
+        self.chat_replays: Dict[int, ReplayBuffer] = {}
         self.sandbox_status = SandboxStatus.OFFLINE
         self.sandbox = None
         self.sandbox_file_paths: Optional[List[str]] = None
         self.sandbox_git_log: Optional[str] = None
+        self.file_index = FileIndex()
         self.tunnels = {}
+        self.sandbox_ready = asyncio.Event()
         self.last_activity = datetime.datetime.now()
 
     def is_inactive(self, timeout_minutes: int = 30) -> bool:
@@ -118,10 +385,22 @@ class ProjectManager:
         if close_tasks:
             await asyncio.gather(*close_tasks)
 
+        for chat_id in list(self.chat_agents):
+            self.turns.cancel_chat(chat_id)
+        for timer in self.orphan_timers.values():
+            timer.cancel()
+        self.orphan_timers.clear()
+
         # Clear socket and agent dictionaries
         self.chat_sockets.clear()
         self.chat_agents.clear()
         self.chat_users.clear()
+        self.remote_sockets.clear()
+        if MULTI_WORKER:
+            project_bus.unsubscribe(_inbox_channel(self.project_id))
+            project_leases.release(self.db, self.project_id)
+        if self.sandbox:
+            await self.sandbox.hibernate()
         project = self.db.query(Project).filter(Project.id == self.project_id).first()
         if project and project.modal_volume_label:
             await DevSandbox.terminate_project_resources(project)
@@ -130,37 +409,65 @@ class ProjectManager:
         print(f"Managing sandbox for project {self.project_id}...")
         self.sandbox_status = SandboxStatus.BUILDING
         await self.emit_project(await self._get_project_status())
+        delay = _RETRY_MIN_SECONDS
         while self.sandbox is None:
             try:
                 self.sandbox = await DevSandbox.get_or_create(self.project_id)
             except SandboxNotReadyException:
                 self.sandbox_status = SandboxStatus.BUILDING_WAITING
                 await self.emit_project(await self._get_project_status())
-            await asyncio.sleep(30)
-        await self.sandbox.wait_for_up()
-        self.sandbox_status = SandboxStatus.READY
-        tunnels = await self.sandbox.sb.tunnels.aio()
-        self.tunnels = {port: tunnel.url for port, tunnel in tunnels.items()}
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_SECONDS)
+        # The preview proxy waits for the dev server's port itself, so the
+        # sandbox is usable as soon as its files are
+        await self.sandbox.start_dev_server()
+        if MULTI_WORKER:
+            # Lets the preview proxy on other workers reach this dev server
+            server = lifecycle_manager.server(self.sandbox.sandbox_id)
+            if server is not None:
+                project_leases.set_preview_port(self.db, self.project_id, server.port)
+        self.tunnels = await self.sandbox.get_tunnels()
         self.sandbox_file_paths, self.sandbox_git_log = await asyncio.gather(
             self.sandbox.get_file_paths(),
             self.sandbox.read_file_contents("/app/git.log", does_not_exist_ok=True),
         )
-        await self.emit_project(await self._get_project_status())
+        await self.file_index.refresh(self.sandbox.sandbox_path, self.sandbox_file_paths)
         for agent in self.chat_agents.values():
             agent.sandbox = self.sandbox
+        self.sandbox_status = SandboxStatus.READY
+        self.sandbox_ready.set()
+        await self.emit_project(await self._get_project_status())
 
     async def _try_manage_sandbox(self):
+        delay = _RETRY_MIN_SECONDS
         while True:
             try:
                 await self._manage_sandbox_task()
                 break
             except Exception as e:
                 print(f"Error managing sandbox {e}\n{traceback.format_exc()}")
-            await asyncio.sleep(30)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _RETRY_MAX_SECONDS)
 
     def start(self):
+        if MULTI_WORKER:
+            # Sockets accepted by other workers reach us through the project bus
+            project_bus.subscribe(_inbox_channel(self.project_id), self.on_remote_frame)
         create_task(self._try_manage_sandbox())
 
+    async def on_remote_frame(self, frame: dict):
+        chat_id, socket_id = frame["chat_id"], frame["socket_id"]
+        if frame["op"] == "join":
+            socket = RemoteSocket(self.project_id, socket_id)
+            self.remote_sockets[socket_id] = socket
+            await self.add_chat_socket(chat_id, socket, frame.get("last_seq"))
+        elif frame["op"] == "leave":
+            socket = self.remote_sockets.pop(socket_id, None)
+            if socket is not None and chat_id in self.chat_sockets:
+                self.remove_chat_socket(chat_id, socket)
+        elif frame["op"] == "frame":
+            await _dispatch_client_frame(self, chat_id, frame["raw"])
+
     async def _get_project_status(self):
         return ProjectStatusResponse(
             project_id=self.project_id,
@@ -170,9 +477,14 @@ class ProjectManager:
             git_log=self.sandbox_git_log,
         )
 
-    async def add_chat_socket(self, chat_id: int, websocket: WebSocket):
+    async def add_chat_socket(
+        self, chat_id: int, websocket: WebSocket, last_seq: Optional[int] = None
+    ):
         self.last_activity = datetime.datetime.now()
-        if chat_id not in self.chat_sockets:
+        timer = self.orphan_timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        if chat_id not in self.chat_agents:
             project = (
                 self.db.query(Project).filter(Project.id == self.project_id).first()
             )
@@ -182,33 +494,85 @@ class ProjectManager:
             agent = Agent(project, stack, user)
             agent.sandbox = self.sandbox
             self.chat_agents[chat_id] = agent
-            self.chat_sockets[chat_id] = []
             self.chat_users[chat_id] = user
-        self.chat_sockets[chat_id].append(websocket)
+        if last_seq is not None:
+            await self._replay(chat_id, websocket, last_seq)
+        # No await since the replay caught up, so no frame can be missed or repeated
+        self.chat_sockets.setdefault(chat_id, []).append(websocket)
+        if self.sandbox:
+            # Resume a hibernated dev server as soon as someone reconnects
+            await self.sandbox.start_dev_server()
         await self.emit_project(await self._get_project_status())
+        await self.emit_chat(chat_id, self.turns.status())
 
     def remove_chat_socket(self, chat_id: int, websocket: WebSocket):
+        self.last_activity = datetime.datetime.now()
+        if self.sandbox:
+            lifecycle_manager.touch(self.sandbox.sandbox_id)
         try:
             self.chat_sockets[chat_id].remove(websocket)
         except ValueError:
             pass
         if len(self.chat_sockets[chat_id]) == 0:
             del self.chat_sockets[chat_id]
-            del self.chat_agents[chat_id]
-            del self.chat_users[chat_id]
+            # Give a reloading tab a chance to reconnect before dropping its turns
+            self.orphan_timers[chat_id] = create_task(self._cancel_orphaned_chat(chat_id))
+
+    async def _replay(self, chat_id: int, websocket: WebSocket, last_seq: int):
+        replay = self.chat_replays.get(chat_id)
+        if replay is None:
+            if last_seq > 0:
+                await websocket.send_json(ReplayGapResponse(chat_id=chat_id).model_dump())
+            return
+        try:
+            while True:
+                frames = replay.since(last_seq)
+                if frames is None:
+                    await websocket.send_json(
+                        ReplayGapResponse(chat_id=chat_id).model_dump()
+                    )
+                    return
+                if not frames:
+                    return
+                for seq, frame in frames:
+                    await websocket.send_json(frame)
+                    last_seq = seq
+        except Exception as e:
+            print(f"Error replaying chat {chat_id}: {e}")
 
-    async def _handle_chat_message(self, chat_id: int, message: ChatMessage):
+    async def _cancel_orphaned_chat(self, chat_id: int):
+        await asyncio.sleep(CHAT_ORPHAN_CANCEL_SECONDS)
+        if chat_id in self.chat_sockets:
+            return
+        self.orphan_timers.pop(chat_id, None)
+        if self.turns.cancel_chat(chat_id):
+            print(f"Cancelled turns for chat {chat_id} with no listeners")
+            await self.emit_queue_status()
+        self.chat_agents.pop(chat_id, None)
+        self.chat_users.pop(chat_id, None)
+        self.chat_replays.pop(chat_id, None)
+
+    async def _handle_chat_message(self, turn: ChatTurn):
+        chat_id, message = turn.chat_id, turn.message
+        # Give a sandbox that is still booting a moment so the turn can use it
+        try:
+            await asyncio.wait_for(self.sandbox_ready.wait(), _SANDBOX_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
         self.sandbox_status = SandboxStatus.WORKING
         await self.emit_project(await self._get_project_status())
+        self._get_replay(chat_id).start_turn()
 
         db_message = _message_to_db_message(message, chat_id)
         self.db.add(db_message)
         self.db.commit()
         self.db.refresh(db_message)
-        await self.emit_chat(
+        await self.emit_chat_stream(
             chat_id,
             ChatUpdateResponse(
-                chat_id=chat_id, message=_db_message_to_message(db_message)
+                chat_id=chat_id,
+                message=_db_message_to_message(db_message),
+                trace_id=turn.trace_id,
             ),
         )
 
@@ -221,18 +585,36 @@ class ProjectManager:
         )
         messages = [_db_message_to_message(m) for m in db_messages]
         total_content = ""
-        async for partial_message in agent.step(
-            messages, self.sandbox_file_paths, self.sandbox_git_log
-        ):
-            total_content += partial_message.delta_content
-            await self.emit_chat(
-                chat_id,
-                ChatChunkResponse(
-                    role="assistant",
-                    content=partial_message.delta_content,
-                    thinking_content=partial_message.delta_thinking_content,
-                ),
-            )
+        try:
+            async for partial_message in agent.step(
+                messages, self.sandbox_file_paths, self.sandbox_git_log, self.file_index
+            ):
+                total_content += partial_message.delta_content
+                await self.emit_chat_stream(
+                    chat_id,
+                    ChatChunkResponse(
+                        role="assistant",
+                        content=partial_message.delta_content,
+                        thinking_content=partial_message.delta_thinking_content,
+                    ),
+                )
+        except asyncio.CancelledError:
+            # Keep what was generated so far; file changes are not applied
+            if total_content:
+                db_partial = _message_to_db_message(
+                    ChatMessage(role="assistant", content=total_content), chat_id
+                )
+                self.db.add(db_partial)
+                self.db.commit()
+                await self.emit_chat_stream(
+                    chat_id,
+                    ChatUpdateResponse(
+                        chat_id=chat_id,
+                        message=_db_message_to_message(db_partial),
+                        trace_id=turn.trace_id,
+                    ),
+                )
+            raise
 
         resp_message = ChatMessage(role="assistant", content=total_content)
         db_resp_message = _message_to_db_message(resp_message, chat_id)
@@ -244,67 +626,233 @@ class ProjectManager:
         self.sandbox_status = SandboxStatus.WORKING_APPLYING
         _, _, follow_ups = await asyncio.gather(
             self.emit_project(await self._get_project_status()),
-            _apply_file_changes(agent, total_content),
+            # A cancel arriving mid-apply must not leave a half-written commit
+            asyncio.shield(
+                _apply_file_changes(
+                    agent,
+                    total_content,
+                    message.content,
+                    self.apply_lock,
+                    lambda usage: self._save_turn_usage(turn, usage),
+                )
+            ),
             agent.suggest_follow_ups(messages + [resp_message]),
         )
 
-        await self.emit_chat(
+        await self.emit_chat_stream(
             chat_id,
             ChatUpdateResponse(
                 chat_id=chat_id,
                 message=_db_message_to_message(db_resp_message),
                 follow_ups=follow_ups,
                 navigate_to=agent.working_page,
+                trace_id=turn.trace_id,
             ),
         )
 
-        self.sandbox_status = SandboxStatus.READY
-        self.sandbox_file_paths, self.sandbox_git_log = await asyncio.gather(
-            self.sandbox.get_file_paths(),
-            self.sandbox.read_file_contents("/app/git.log", does_not_exist_ok=True),
-        )
-        await self.emit_project(await self._get_project_status())
-
-    async def _try_handle_chat_message(self, chat_id: int, message: ChatMessage):
+    async def _relist_files(self):
+        if self.sandbox is None:
+            return
         try:
-            await self._handle_chat_message(chat_id, message)
+            with span("sandbox.relist_files"):
+                self.sandbox_file_paths, self.sandbox_git_log = await asyncio.gather(
+                    self.sandbox.get_file_paths(),
+                    self.sandbox.read_file_contents("/app/git.log", does_not_exist_ok=True),
+                )
+                # Only re-reads files that changed
+                await self.file_index.refresh(self.sandbox.sandbox_path, self.sandbox_file_paths)
         except Exception as e:
-            print(
-                f"Error in chat message: {str(e)}\nTraceback:\n{traceback.format_exc()}"
-            )
+            print(f"Failed to relist files for project {self.project_id}: {e}")
+
+    def _set_idle_status(self, turn: ChatTurn):
+        # Other chats' turns may still be running alongside this one
+        if not self.turns.is_busy(other_than=turn):
             self.sandbox_status = SandboxStatus.READY
-            await self.emit_project(await self._get_project_status())
+
+    async def _try_handle_chat_message(self, turn: ChatTurn):
+        with span(
+            "chat.turn",
+            project_id=self.project_id,
+            chat_id=turn.chat_id,
+            read_only=turn.read_only,
+        ) as turn_span, track_usage() as usage:
+            turn.trace_id = turn_span.trace_id
+            try:
+                await self._handle_chat_message(turn)
+            except asyncio.CancelledError:
+                turn_span.set_attribute("cancelled", True)
+                print(f"Cancelled chat turn for chat {turn.chat_id}")
+            except Exception as e:
+                turn_span.record_exception(e)
+                print(
+                    f"Error in chat message (trace {turn.trace_id}): {str(e)}\nTraceback:\n{traceback.format_exc()}"
+                )
+            finally:
+                # Cancelled and failed turns still spent their tokens
+                self._save_turn_usage(turn, usage)
+                self._set_idle_status(turn)
+                # ...and may have changed files (e.g. via run_command) before stopping
+                await self._relist_files()
+                await self.emit_project(await self._get_project_status())
+
+    def _save_turn_usage(self, turn: ChatTurn, usage: UsageTracker):
+        try:
+            project = self.db.query(Project).filter(Project.id == self.project_id).first()
+            if project is not None:
+                save_usage(
+                    self.db, usage, project.team_id, self.project_id, turn.chat_id, turn.trace_id
+                )
+        except Exception as e:
+            self.db.rollback()
+            print(f"Failed to save token usage for chat {turn.chat_id}: {e}")
 
     async def on_chat_message(self, chat_id: int, message: ChatMessage):
         self.last_activity = datetime.datetime.now()
-        if not await self.lock.acquire():
-            return
-        await self._try_handle_chat_message(chat_id, message)
-        self.lock.release()
+        self.turns.submit(ChatTurn(chat_id, message, _is_read_only_turn(message)))
+        await self.emit_queue_status()
+
+    async def on_cancel(self, chat_id: int):
+        self.last_activity = datetime.datetime.now()
+        if self.turns.cancel_chat(chat_id):
+            await self.emit_queue_status()
+
+    async def emit_queue_status(self):
+        await self.emit_project(self.turns.status())
 
     async def emit_project(self, data: BaseModel):
         await asyncio.gather(
             *[self.emit_chat(chat_id, data) for chat_id in self.chat_sockets]
         )
 
+    def _get_replay(self, chat_id: int) -> ReplayBuffer:
+        if chat_id not in self.chat_replays:
+            self.chat_replays[chat_id] = ReplayBuffer(CHAT_REPLAY_MAX_FRAMES)
+        return self.chat_replays[chat_id]
+
+    async def emit_chat_stream(self, chat_id: int, data: BaseModel):
+        """Emit a numbered chat frame that reconnecting clients can replay."""
+        await self._send_chat(chat_id, self._get_replay(chat_id).record(data))
+
     async def emit_chat(self, chat_id: int, data: BaseModel):
+        await self._send_chat(chat_id, data.model_dump())
+
+    async def _send_chat(self, chat_id: int, frame: dict):
         if chat_id not in self.chat_sockets:
             return
         sockets = list(self.chat_sockets[chat_id])
 
         async def _try_send(socket: WebSocket):
             try:
-                await socket.send_json(data.model_dump())
+                await socket.send_json(frame)
             except Exception:
                 try:
                     self.chat_sockets[chat_id].remove(socket)
-                except ValueError:
+                except (KeyError, ValueError):
                     pass
 
         await asyncio.gather(*[_try_send(socket) for socket in sockets])
 
 
+async def _dispatch_client_frame(pm: ProjectManager, chat_id: int, raw_data: str):
+    try:
+        frame = json.loads(raw_data)
+        if not isinstance(frame, dict):
+            raise ValueError("frame is not an object")
+        if frame.get("action") == "cancel":
+            await pm.on_cancel(chat_id)
+            return
+        # pydantic's ValidationError is a ValueError too
+        message = ChatMessage.model_validate(frame)
+    except ValueError as e:
+        print(f"Ignoring malformed frame for chat {chat_id}: {e}")
+        return
+    await pm.on_chat_message(chat_id, message)
+
+
+class ProjectRelay:
+    """Forwards this worker's websockets for a project managed by another worker."""
+
+    def __init__(self, project_id: int):
+        self.project_id = project_id
+        self.sockets: Dict[str, WebSocket] = {}
+        project_bus.subscribe(_outbox_channel(project_id), self._on_owner_frame)
+
+    async def _on_owner_frame(self, frame: dict):
+        socket = self.sockets.get(frame["socket_id"])
+        if socket is None:
+            return
+        try:
+            if frame.get("close"):
+                await socket.close()
+            else:
+                await socket.send_json(frame["data"])
+        except Exception:
+            pass
+
+    def send(self, op: str, chat_id: int, socket_id: str, raw: Optional[str] = None):
+        project_bus.publish(
+            _inbox_channel(self.project_id),
+            {"op": op, "chat_id": chat_id, "socket_id": socket_id, "raw": raw},
+        )
+
+    def join(
+        self, chat_id: int, socket_id: str, websocket: WebSocket, last_seq: Optional[int]
+    ):
+        self.sockets[socket_id] = websocket
+        project_bus.publish(
+            _inbox_channel(self.project_id),
+            {"op": "join", "chat_id": chat_id, "socket_id": socket_id, "last_seq": last_seq},
+        )
+
+    def leave(self, chat_id: int, socket_id: str):
+        self.sockets.pop(socket_id, None)
+        self.send("leave", chat_id, socket_id)
+        if not self.sockets:
+            project_bus.unsubscribe(_outbox_channel(self.project_id))
+            project_relays.pop(self.project_id, None)
+
+    async def close_all(self, code: int):
+        await asyncio.gather(
+            *[socket.close(code=code) for socket in list(self.sockets.values())],
+            return_exceptions=True,
+        )
+
+
 project_managers: Dict[int, ProjectManager] = {}
+PROJECT_MANAGERS.set_function(lambda: len(project_managers))
+project_relays: Dict[int, ProjectRelay] = {}
+
+
+def _get_project_manager(db: Session, project_id: int) -> Optional[ProjectManager]:
+    """This worker's manager for the project, or None if another worker owns it."""
+    if project_id in project_managers:
+        return project_managers[project_id]
+    if MULTI_WORKER and not project_leases.acquire(db, project_id):
+        return None
+    pm = ProjectManager(db, project_id)
+    pm.start()
+    project_managers[project_id] = pm
+    return pm
+
+
+async def _relay_websocket(
+    websocket: WebSocket, project_id: int, chat_id: int, last_seq: Optional[int]
+):
+    if project_id not in project_relays:
+        project_relays[project_id] = ProjectRelay(project_id)
+    relay = project_relays[project_id]
+    socket_id = uuid.uuid4().hex
+    relay.join(chat_id, socket_id, websocket, last_seq)
+    try:
+        while True:
+            raw_data = await websocket.receive_text()
+            relay.send("frame", chat_id, socket_id, raw_data)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except Exception as e:
+        print(f"websocket relay Exception: {e}\n{traceback.format_exc()}")
+    finally:
+        relay.leave(chat_id, socket_id)
 
 
 @router.websocket("/api/ws/chat/{chat_id}")
@@ -320,21 +868,31 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: int):
     if project is None:
         raise WebSocketException(code=404, reason="Project not found")
 
-    if project.id not in project_managers:
-        pm = ProjectManager(db, project.id)
-        pm.start()
-        project_managers[project.id] = pm
-    else:
-        pm = project_managers[project.id]
+    # Sequence number of the last chat frame a reconnecting client received
+    last_seq = websocket.query_params.get("last_seq")
+    last_seq = int(last_seq) if last_seq and last_seq.isdigit() else None
 
+    pm = _get_project_manager(db, project.id)
     await websocket.accept()
-    await pm.add_chat_socket(chat_id, websocket)
+    ACTIVE_WEBSOCKETS.inc()
+    if pm is None:
+        try:
+            await _relay_websocket(websocket, project.id, chat_id, last_seq)
+        finally:
+            ACTIVE_WEBSOCKETS.dec()
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+            db.close()
+        return
+
+    await pm.add_chat_socket(chat_id, websocket, last_seq)
 
     try:
         while True:
             raw_data = await websocket.receive_text()
-            data = ChatMessage.model_validate_json(raw_data)
-            create_task(pm.on_chat_message(chat_id, data))
+            await _dispatch_client_frame(pm, chat_id, raw_data)
     except WebSocketDisconnect:
         pass
     except RuntimeError as e:
@@ -345,6 +903,7 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: int):
     except Exception as e:
         print(f"websocket loop Exception: {e}\n{traceback.format_exc()}")
     finally:
+        ACTIVE_WEBSOCKETS.dec()
         pm.remove_chat_socket(chat_id, websocket)
         try:
             await websocket.close()
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from sqlalchemy import and_
 from sse_starlette.sse import EventSourceResponse
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 import requests
 import json
 import re
@@ -19,6 +19,7 @@ from schemas.models import (
     ChatResponse,
 )
 from sandbox.sandbox import DevSandbox, SandboxNotReadyException
+from sandbox.exports import export_cache
 from routers.auth import get_current_user_from_token
 
 router = APIRouter(prefix="/api/teams/{team_id}/projects", tags=["projects"])
@@ -189,40 +190,10 @@ async def generate_project_zip(
     except SandboxNotReadyException:
         raise HTTPException(status_code=400, detail="Sandbox not ready. Project must be running.")
 
-    git_sha = await sandbox.run_command("git rev-parse HEAD")
-    if not git_sha.strip():
-        git_sha = "init"
-    else:
-        git_sha = git_sha.strip()[:10]
-    git_sha_fn = f"app-{project.id}-{git_sha}.zip".replace(" ", "-")
-
-    # I dont know why but getting it to ignore has been a pain
-    exclude_content = """
-**/node_modules/**
-**/.next/**
-**/build/**
-git.log
-**/git.log
-tmp
-tmp/
-**/tmp
-**/tmp/
-/tmp
-/tmp/
-.git
-.git/
-**/.git
-**/.git/
-""".strip()
-    await sandbox.run_command(f"echo '{exclude_content}' > /tmp/zip-exclude.txt")
-    await sandbox.run_command("mkdir -p /app/tmp")
-    
-    # Clean up any tmp directories before zipping
-    await sandbox.run_command("find /app -type d -name 'tmp' -exec rm -rf {} +")
-    
-    out = await sandbox.run_command(
-        f"cd /app && zip -r /app/tmp/{git_sha_fn} . -x@/tmp/zip-exclude.txt"
-    )
+    export_cache.watch(project.id)
+    git_sha = await sandbox.get_head_sha()
+    git_sha = git_sha[:10] if git_sha else "init"
+    git_sha_fn = f"app-{project.id}-{git_sha}.zip"
 
     return JSONResponse(content={"url": f"/api/teams/{team_id}/projects/{project_id}/download-zip?path={git_sha_fn}"})
 
@@ -239,41 +210,31 @@ async def get_project_download_zip(
         raise HTTPException(status_code=404, detail="Project not found")
 
     # Validate path format and prevent directory traversal
-    expected_prefix = f"app-{project_id}-"
-    if (
-        not path.startswith(expected_prefix) 
-        or not path.endswith(".zip")
-        or "/" in path 
-        or "\\" in path 
-        or ".." in path
-        or not re.match(r"^app-\d+-[a-f0-9]{1,10}\.zip$", path)
-    ):
+    match = re.match(rf"^app-{project_id}-(init|[a-f0-9]{{1,10}})\.zip$", path)
+    if not match:
         raise HTTPException(status_code=400, detail="Invalid zip file path")
+    requested_sha = match.group(1)
 
     try:
         sandbox = await DevSandbox.get_or_create(project.id, create_if_missing=False)
-        file_size = await sandbox.run_command(f"stat -c%s /app/tmp/{path}")
-        file_size = int(file_size.strip())
-
-        async def _stream_zip():
-            try:
-                async for chunk in sandbox.stream_file_contents(f"/app/tmp/{path}", binary_mode=True):
-                    yield chunk
-            finally:
-                # Clean up the zip file after streaming
-                await sandbox.run_command(f"rm -f /tmp/{path}")
-
-        return StreamingResponse(
-            _stream_zip(),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f'attachment; filename="{path}"',
-                "Content-Length": str(file_size)
-            }
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error accessing zip file: {str(e)}")
-    
+    except SandboxNotReadyException:
+        raise HTTPException(status_code=400, detail="Sandbox not ready. Project must be running.")
+
+    git_sha = await sandbox.get_head_sha()
+    # Only HEAD can be exported, so refuse links for any other commit
+    if not (git_sha or "init").startswith(requested_sha):
+        raise HTTPException(status_code=409, detail="Project has changed since this download was requested")
+    cached_path = export_cache.get(project.id, git_sha) if git_sha else None
+    if cached_path:
+        return FileResponse(cached_path, media_type="application/zip", filename=path)
+
+    return StreamingResponse(
+        export_cache.stream(sandbox, git_sha),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{path}"'},
+    )
+
+
 @router.get("/{project_id}/deploy-status/github")
 async def deploy_status_github(
     team_id: int,
@@ -285,6 +246,7 @@ async def deploy_status_github(
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    export_cache.watch(project.id)
     sandbox = await DevSandbox.get_or_create(project.id, create_if_missing=False)
     has_origin = "origin" in await sandbox.run_command("git remote -v")
     env_text = await sandbox.run_command("cat /app/.env")
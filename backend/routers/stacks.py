@@ -1,10 +1,15 @@
+import asyncio
 from fastapi import APIRouter, Depends
-from typing import List
+from typing import Dict, List
 from sqlalchemy.orm import Session
 
 from db.database import get_db
 from schemas.models import StackResponse
-from db.models import Stack
+from db.models import Stack, User
+from routers.auth import require_admin
+from sandbox.pool import pool_scheduler
+from sandbox.deps import dependency_store
+from sandbox.lifecycle import SandboxUsage, lifecycle_manager
 
 router = APIRouter(prefix="/api/stacks", tags=["stacks"])
 
@@ -14,4 +19,28 @@ async def get_stacks(db: Session = Depends(get_db)):
     """
     Get all available stacks that can be used as templates for new projects.
     """
-    return db.query(Stack).all()
\ No newline at end of file
+    return db.query(Stack).all()
+
+
+@router.get("/pool-stats", response_model=Dict[int, Dict[str, int]])
+async def get_pool_stats(_: User = Depends(require_admin), db: Session = Depends(get_db)):
+    """
+    Get prepared sandbox pool sizes, targets and hit/miss counts per stack.
+    """
+    return pool_scheduler.stats(db)
+
+
+@router.get("/deps-stats", response_model=Dict[str, int])
+async def get_deps_stats(_: User = Depends(require_admin)):
+    """
+    Get shared dependency store size and disk saved by linking into sandboxes.
+    """
+    return dependency_store.stats()
+
+
+@router.get("/sandbox-stats", response_model=Dict[str, SandboxUsage])
+async def get_sandbox_stats(_: User = Depends(require_admin)):
+    """
+    Get state, processes, memory and CPU of the sandboxes running on this worker.
+    """
+    return await asyncio.to_thread(lifecycle_manager.stats)
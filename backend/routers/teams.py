@@ -2,15 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 import secrets
 import datetime
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from db.models import User, TeamInvite, TeamMember, Team, TeamRole
+from db.models import User, TeamInvite, TeamMember, Team, TeamRole, UsageRollup
 from schemas.models import (
     TeamResponse,
     TeamInviteResponse,
     TeamUpdate,
     TeamMemberResponse,
     TeamMemberUpdate,
+    UsageResponse,
 )
 from routers.auth import get_current_user_from_token
 from db.database import get_db
@@ -171,6 +173,51 @@ async def get_team_members(
     ]
 
 
+@router.get("/{team_id}/usage", response_model=List[UsageResponse])
+async def get_team_usage(
+    team_id: int,
+    days: int = 30,
+    current_user: User = Depends(get_current_user_from_token),
+    db: Session = Depends(get_db),
+):
+    # Verify user is a member of the team
+    member = db.query(TeamMember).filter(
+        TeamMember.team_id == team_id,
+        TeamMember.user_id == current_user.id
+    ).first()
+    if not member:
+        raise HTTPException(status_code=403, detail="Not a member of this team")
+
+    # Token totals per project and phase over the last `days` days,
+    # project_id 0 is usage outside any project
+    since = datetime.date.today() - datetime.timedelta(days=days - 1)
+    rows = (
+        db.query(
+            UsageRollup.project_id,
+            UsageRollup.phase,
+            func.sum(UsageRollup.calls).label("calls"),
+            func.sum(UsageRollup.prompt_tokens).label("prompt_tokens"),
+            func.sum(UsageRollup.completion_tokens).label("completion_tokens"),
+            func.sum(UsageRollup.cached_tokens).label("cached_tokens"),
+        )
+        .filter(UsageRollup.team_id == team_id, UsageRollup.day >= since)
+        .group_by(UsageRollup.project_id, UsageRollup.phase)
+        .order_by(UsageRollup.project_id, UsageRollup.phase)
+        .all()
+    )
+    return [
+        {
+            "project_id": row.project_id,
+            "phase": row.phase,
+            "calls": row.calls,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+            "cached_tokens": row.cached_tokens,
+        }
+        for row in rows
+    ]
+
+
 @router.patch("/{team_id}/members/{user_id}", response_model=TeamMemberResponse)
 async def update_team_member(
     team_id: int,
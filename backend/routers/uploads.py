@@ -1,50 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
-import os
-import uuid
-import shutil
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from typing import Optional
 
 from schemas.models import ImageUploadSignURL
 from db.models import User
 from routers.auth import get_current_user_from_token
+from storage.uploads import THUMBNAIL_WIDTHS, UploadTooLarge, upload_store
 
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 
-# Create uploads directory if it doesn't exist
-UPLOADS_DIR = Path("/app/uploads")
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+# Content-addressed files never change, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 @router.post("/upload-image")
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user_from_token),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    file_ext = os.path.splitext(file.filename)[1]
-    file_key = f"image_uploads/{uuid.uuid4()}{file_ext}"
-    file_path = UPLOADS_DIR / file_key
-
+    # Parsed by the store rather than declared as a File() parameter, so oversized
+    # bodies are cut off as they arrive instead of being spooled to disk first.
+    # Downsized, re-encoded and named by content hash, so identical images are stored once
     try:
-        # Ensure the parent directory exists
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Save uploaded file
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        file_key = await upload_store.save_image(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {
         "file_key": file_key,
         "url": f"/api/uploads/images/{file_key}",
     }
 
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches, using the weak comparison it calls for."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip().removeprefix("W/") for candidate in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
 @router.get("/images/{file_key:path}")
-async def get_image(file_key: str):
-    file_path = UPLOADS_DIR / file_key
-    if not file_path.exists():
+async def get_image(file_key: str, request: Request, w: Optional[int] = None):
+    if w is not None and w not in THUMBNAIL_WIDTHS:
+        raise HTTPException(
+            status_code=400, detail=f"Thumbnail width must be one of {list(THUMBNAIL_WIDTHS)}"
+        )
+    digest = upload_store.blob_hash(file_key)
+    if digest is None:
+        # Uploads from before content addressing, FileResponse sets an mtime-based ETag
+        file_path = upload_store.path(file_key)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        if w is not None:
+            file_path = await upload_store.thumbnail(file_key, w)
+            if file_path is None:
+                raise HTTPException(status_code=404, detail="Image not found")
+        return FileResponse(file_path)
+
+    if upload_store.path(file_key) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{digest}-{w}"' if w else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    file_path = (
+        await upload_store.thumbnail(file_key, w) if w else upload_store.path(file_key)
+    )
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path)
\ No newline at end of file
+    return FileResponse(file_path, headers=headers)
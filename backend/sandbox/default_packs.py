@@ -67,13 +67,13 @@ set +a
 _START_REACT_CMD = f"""
 {_SETUP_COMMON_CMD}
 cd /app/frontend
-bun run dev
+bun run dev --port ${{PORT:-3000}} --strictPort --base ${{BASE_PATH:-/}}
 """.strip()
 
 _START_VUE_CMD = f"""
 {_SETUP_COMMON_CMD}
 cd /app/frontend
-bun run dev
+bun run dev --port ${{PORT:-3000}} --strictPort --base ${{BASE_PATH:-/}}
 """.strip()
 
 
@@ -0,0 +1,158 @@
+import os
+import asyncio
+import hashlib
+import shutil
+import subprocess
+import uuid
+from typing import Dict, List, Optional
+
+DEPS_ROOT = "/tmp/promptstudio/deps"
+PACKAGE_CACHE_DIR = os.path.join(DEPS_ROOT, "package-cache")
+MANIFEST_FILES = ["package.json", "package-lock.json", "bun.lockb", "yarn.lock", "pnpm-lock.yaml"]
+
+# Shared download caches so `npm install`/`bun install` in any sandbox reuse fetched packages
+SANDBOX_ENV = {
+    "npm_config_cache": os.path.join(PACKAGE_CACHE_DIR, "npm"),
+    "npm_config_prefer_offline": "true",
+    "BUN_INSTALL_CACHE_DIR": os.path.join(PACKAGE_CACHE_DIR, "bun"),
+}
+
+
+def _manifest_key(package_dir: str) -> str:
+    digest = hashlib.sha256()
+    for name in MANIFEST_FILES:
+        path = os.path.join(package_dir, name)
+        if os.path.isfile(path):
+            digest.update(name.encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _find_package_dirs(root_path: str, max_depth: int = 2) -> List[str]:
+    package_dirs = []
+    for root, dirs, files in os.walk(root_path):
+        dirs[:] = [d for d in dirs if d not in ("node_modules", ".git")]
+        if root[len(root_path):].count(os.sep) >= max_depth:
+            dirs[:] = []
+        if "package.json" in files:
+            package_dirs.append(root)
+    return package_dirs
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _clone_tree(src: str, dst: str) -> bool:
+    """Copy-on-write clone of src (btrfs/xfs reflinks), or a full copy where the
+    filesystem lacks them. Returns whether the clone shares disk blocks with src.
+
+    Never hardlink: npm, postinstall scripts and agent commands write into
+    node_modules in place and would change the store and every other sandbox."""
+    result = subprocess.run(
+        ["cp", "-a", "--reflink=always", src, dst],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode == 0:
+        return True
+    shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True)
+    return False
+
+
+class DependencyStore:
+    """Content-addressed node_modules trees, cloned into sandboxes by manifest hash."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.links = 0
+        self.copies = 0
+        self.bytes_saved = 0
+        self._sizes: Dict[str, int] = {}
+        os.makedirs(self.root, exist_ok=True)
+        for path in SANDBOX_ENV.values():
+            if path.startswith(self.root):
+                os.makedirs(path, exist_ok=True)
+
+    def _store_path(self, key: str) -> str:
+        return os.path.join(self.root, key, "node_modules")
+
+    def _size(self, key: str) -> int:
+        if key not in self._sizes:
+            self._sizes[key] = _tree_size(self._store_path(key))
+        return self._sizes[key]
+
+    def _ingest_dir(self, package_dir: str, remove: bool) -> Optional[str]:
+        node_modules = os.path.join(package_dir, "node_modules")
+        if not os.path.isdir(node_modules):
+            return None
+        key = _manifest_key(package_dir)
+        store_path = self._store_path(key)
+        if not os.path.isdir(store_path):
+            tmp_path = os.path.join(self.root, f".{uuid.uuid4()}")
+            os.makedirs(tmp_path)
+            try:
+                if remove:
+                    os.rename(node_modules, os.path.join(tmp_path, "node_modules"))
+                else:
+                    _clone_tree(node_modules, os.path.join(tmp_path, "node_modules"))
+                os.rename(tmp_path, os.path.dirname(store_path))
+            except OSError:
+                # Another sandbox published the same key first
+                pass
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        if remove:
+            shutil.rmtree(node_modules, ignore_errors=True)
+        return key
+
+    def _link_dir(self, package_dir: str):
+        node_modules = os.path.join(package_dir, "node_modules")
+        if os.path.exists(node_modules):
+            return
+        key = _manifest_key(package_dir)
+        store_path = self._store_path(key)
+        if not os.path.isdir(store_path):
+            return
+        if _clone_tree(store_path, node_modules):
+            self.links += 1
+            self.bytes_saved += self._size(key)
+        else:
+            # Still saves the install, just not the disk space
+            self.copies += 1
+
+    async def ingest(self, root_path: str, remove: bool = False):
+        """Publish node_modules found under root_path into the store."""
+        for package_dir in _find_package_dirs(root_path):
+            await asyncio.to_thread(self._ingest_dir, package_dir, remove)
+
+    async def link(self, root_path: str):
+        """Clone stored node_modules into every package under root_path that lacks them."""
+        for package_dir in _find_package_dirs(root_path):
+            await asyncio.to_thread(self._link_dir, package_dir)
+
+    def stats(self) -> Dict[str, int]:
+        keys = [
+            name
+            for name in os.listdir(self.root)
+            if not name.startswith(".") and os.path.isdir(self._store_path(name))
+        ]
+        return {
+            "entries": len(keys),
+            "store_bytes": sum(self._size(key) for key in keys),
+            "links": self.links,
+            "copies": self.copies,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+dependency_store = DependencyStore(DEPS_ROOT)
@@ -0,0 +1,146 @@
+import os
+import asyncio
+import datetime
+import traceback
+from collections import OrderedDict
+from typing import AsyncGenerator, Dict, Optional, Tuple
+
+from config import EXPORT_CACHE_MAX_BYTES, EXPORT_WATCH_MINUTES
+from sandbox.sandbox import DevSandbox, _unique_id
+
+EXPORTS_ROOT = "/tmp/promptstudio/exports"
+
+ExportKey = Tuple[int, str]
+
+
+def _key_from_filename(filename: str) -> Optional[ExportKey]:
+    name, ext = os.path.splitext(filename)
+    project_id, _, sha = name.partition("-")
+    if ext != ".zip" or not project_id.isdigit() or not sha:
+        return None
+    return int(project_id), sha
+
+
+class ExportCache:
+    """On-disk zip exports keyed by (project_id, git sha) with LRU size-based eviction."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[ExportKey, int]" = OrderedDict()
+        self._building: Dict[ExportKey, asyncio.Task] = {}
+        self._watched: Dict[int, datetime.datetime] = {}
+        os.makedirs(self.root, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        existing = []
+        for filename in os.listdir(self.root):
+            key = _key_from_filename(filename)
+            if key is None:
+                continue
+            stat = os.stat(os.path.join(self.root, filename))
+            existing.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+        self._evict()
+
+    def _path(self, key: ExportKey) -> str:
+        project_id, sha = key
+        return os.path.join(self.root, f"{project_id}-{sha}.zip")
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._entries.values())
+
+    def _evict(self):
+        while self._entries and self.total_bytes > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _store(self, key: ExportKey, tmp_path: str):
+        path = self._path(key)
+        os.replace(tmp_path, path)
+        self._entries[key] = os.path.getsize(path)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def get(self, project_id: int, sha: str) -> Optional[str]:
+        key = (project_id, sha)
+        if key not in self._entries:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    def watch(self, project_id: int):
+        """Mark a project as likely to be exported soon (e.g. its Deploy tab is open)."""
+        self._watched[project_id] = datetime.datetime.now() + datetime.timedelta(
+            minutes=EXPORT_WATCH_MINUTES
+        )
+
+    def is_watched(self, project_id: int) -> bool:
+        expires_at = self._watched.get(project_id)
+        if expires_at is None:
+            return False
+        if expires_at < datetime.datetime.now():
+            del self._watched[project_id]
+            return False
+        return True
+
+    async def stream(
+        self, sandbox: DevSandbox, sha: Optional[str]
+    ) -> AsyncGenerator[bytes, None]:
+        """Stream a fresh export, storing it in the cache once fully written."""
+        if sha is None:
+            async for chunk in sandbox.stream_zip():
+                yield chunk
+            return
+
+        key = (sandbox.project_id, sha)
+        tmp_path = os.path.join(self.root, f".{_unique_id()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in sandbox.stream_zip():
+                    f.write(chunk)
+                    yield chunk
+            # Only keep the archive if no commit landed while we were zipping
+            if await sandbox.get_head_sha() == sha:
+                self._store(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _build(self, sandbox: DevSandbox, sha: str):
+        async for _ in self.stream(sandbox, sha):
+            pass
+
+    async def _try_build(self, sandbox: DevSandbox, key: ExportKey):
+        try:
+            await self._build(sandbox, key[1])
+            print(f"Pre-built export for project {key[0]} at {key[1][:10]}")
+        except Exception as e:
+            print(f"Error pre-building export {key}: {e}\n{traceback.format_exc()}")
+        finally:
+            self._building.pop(key, None)
+
+    async def prebuild(self, sandbox: DevSandbox):
+        """Build the export for the sandbox's HEAD in the background if it is being watched."""
+        if not self.is_watched(sandbox.project_id):
+            return
+        sha = await sandbox.get_head_sha()
+        if sha is None:
+            return
+        key = (sandbox.project_id, sha)
+        if key in self._entries or key in self._building:
+            return
+        self._building[key] = asyncio.create_task(self._try_build(sandbox, key))
+
+
+export_cache = ExportCache(EXPORTS_ROOT, EXPORT_CACHE_MAX_BYTES)
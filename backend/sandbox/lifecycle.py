@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+import datetime
+from enum import Enum
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from sandbox.supervisor import DevServer, port_allocator
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class SandboxState(str, Enum):
+    STOPPED = "STOPPED"
+    RUNNING = "RUNNING"
+    HIBERNATED = "HIBERNATED"
+
+
+class SandboxUsage(BaseModel):
+    state: SandboxState
+    port: Optional[int] = None
+    restarts: int = 0
+    processes: int = 0
+    rss_bytes: int = 0
+    cpu_seconds: float = 0.0
+    cpu_percent: float = 0.0
+
+
+def _read_session_usage(session_ids: Set[int]) -> Dict[int, Tuple[int, int, float]]:
+    """(processes, rss bytes, cpu seconds) summed per session, from one pass over /proc."""
+    totals = {session_id: [0, 0, 0] for session_id in session_ids}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the command name, which may itself contain spaces
+        fields = stat[stat.rfind(")") + 2 :].split()
+        total = totals.get(int(fields[3]))
+        if total is None:
+            continue
+        total[0] += 1
+        total[1] += int(fields[21]) * _PAGE_SIZE
+        total[2] += int(fields[11]) + int(fields[12])
+    return {
+        session_id: (processes, rss, ticks / _CLOCK_TICKS)
+        for session_id, (processes, rss, ticks) in totals.items()
+    }
+
+
+class LifecycleManager:
+    """Runs each sandbox's dev server and hibernates it while nobody is connected."""
+
+    def __init__(self):
+        self._servers: Dict[str, DevServer] = {}
+        self._states: Dict[str, SandboxState] = {}
+        self._last_active: Dict[str, datetime.datetime] = {}
+        self._cpu_samples: Dict[str, Tuple[float, float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, sandbox_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(sandbox_id, asyncio.Lock())
+
+    def state(self, sandbox_id: str) -> SandboxState:
+        return self._states.get(sandbox_id, SandboxState.STOPPED)
+
+    def touch(self, sandbox_id: str):
+        self._last_active[sandbox_id] = datetime.datetime.now()
+
+    def server(self, sandbox_id: str) -> Optional[DevServer]:
+        return self._servers.get(sandbox_id)
+
+    def is_running(self, sandbox_id: str) -> bool:
+        server = self._servers.get(sandbox_id)
+        return server is not None and server.running
+
+    async def resume(
+        self, sandbox_id: str, sandbox_path: str, command: Optional[str], env: Dict[str, str]
+    ):
+        """Start the dev server unless it is already running. Files are untouched."""
+        self.touch(sandbox_id)
+        async with self._lock(sandbox_id):
+            if self.is_running(sandbox_id) or not command:
+                return
+            server = self._servers.get(sandbox_id)
+            if server is None:
+                server = DevServer(sandbox_id, sandbox_path, command, env)
+                self._servers[sandbox_id] = server
+            server.start()
+            self._states[sandbox_id] = SandboxState.RUNNING
+            print(f"Started dev server for sandbox {sandbox_id} on port {server.port}")
+
+    async def stop(self, sandbox_id: str):
+        async with self._lock(sandbox_id):
+            self._cpu_samples.pop(sandbox_id, None)
+            server = self._servers.get(sandbox_id)
+            if server is not None:
+                await server.stop()
+
+    async def hibernate(self, sandbox_id: str):
+        if not self.is_running(sandbox_id):
+            return
+        await self.stop(sandbox_id)
+        self._states[sandbox_id] = SandboxState.HIBERNATED
+        print(f"Hibernated sandbox {sandbox_id}")
+
+    async def forget(self, sandbox_id: str):
+        await self.stop(sandbox_id)
+        self._servers.pop(sandbox_id, None)
+        port_allocator.release(sandbox_id)
+        self._states.pop(sandbox_id, None)
+        self._last_active.pop(sandbox_id, None)
+        self._locks.pop(sandbox_id, None)
+
+    async def hibernate_idle(self, active_sandbox_ids: List[str], idle_minutes: int):
+        cutoff = datetime.datetime.now() - datetime.timedelta(minutes=idle_minutes)
+        for sandbox_id in list(self._servers):
+            if sandbox_id in active_sandbox_ids:
+                continue
+            if self._last_active.get(sandbox_id, cutoff) <= cutoff:
+                await self.hibernate(sandbox_id)
+
+    def _usage(
+        self, sandbox_id: str, session_usage: Dict[int, Tuple[int, int, float]]
+    ) -> SandboxUsage:
+        state = self.state(sandbox_id)
+        server = self._servers.get(sandbox_id)
+        if server is None or server.pid is None:
+            return SandboxUsage(state=state)
+        processes, rss, cpu_seconds = session_usage.get(server.pid, (0, 0, 0.0))
+        now = time.monotonic()
+        cpu_percent = 0.0
+        last = self._cpu_samples.get(sandbox_id)
+        if last is not None and now > last[0]:
+            cpu_percent = 100.0 * (cpu_seconds - last[1]) / (now - last[0])
+        self._cpu_samples[sandbox_id] = (now, cpu_seconds)
+        return SandboxUsage(
+            state=state,
+            port=server.port,
+            restarts=server.restarts,
+            processes=processes,
+            rss_bytes=rss,
+            cpu_seconds=cpu_seconds,
+            cpu_percent=cpu_percent,
+        )
+
+    def _session_ids(self, sandbox_ids: List[str]) -> Set[int]:
+        servers = [self._servers.get(sandbox_id) for sandbox_id in sandbox_ids]
+        return {server.pid for server in servers if server is not None and server.pid is not None}
+
+    def usage(self, sandbox_id: str) -> SandboxUsage:
+        session_usage = _read_session_usage(self._session_ids([sandbox_id]))
+        return self._usage(sandbox_id, session_usage)
+
+    def stats(self) -> Dict[str, SandboxUsage]:
+        """Usage of every sandbox this worker knows about, reading /proc once for all of them."""
+        sandbox_ids = list(self._states)
+        session_usage = _read_session_usage(self._session_ids(sandbox_ids))
+        return {sandbox_id: self._usage(sandbox_id, session_usage) for sandbox_id in sandbox_ids}
+
+
+lifecycle_manager = LifecycleManager()
@@ -0,0 +1,188 @@
+import os
+import math
+import shutil
+import asyncio
+import traceback
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import (
+    TARGET_PREPARED_SANDBOXES_PER_STACK,
+    MIN_PREPARED_SANDBOXES_PER_STACK,
+    PREPARED_POOL_BUILD_CONCURRENCY,
+    PREPARED_POOL_DEMAND_WINDOW_MINUTES,
+    PREPARED_POOL_LOOKAHEAD_MINUTES,
+)
+from db.database import SessionLocal
+from db.models import PreparedSandbox, Stack
+from sandbox.sandbox import DevSandbox, TEMPLATE_ROOT, _get_sandbox_path
+from telemetry.metrics import PREPARED_SANDBOXES, SANDBOX_POOL_CLAIMS
+
+
+def _remove_sandbox_dir(sandbox_id: Optional[str]):
+    if sandbox_id:
+        shutil.rmtree(_get_sandbox_path(sandbox_id), ignore_errors=True)
+
+
+class PoolScheduler:
+    """Keeps a pool of prepared sandboxes per stack, sized from recent claim demand."""
+
+    def __init__(self):
+        self._claims: Dict[int, Deque[datetime]] = defaultdict(deque)
+        self._building: Dict[int, int] = defaultdict(int)
+        self._build_semaphore = asyncio.Semaphore(PREPARED_POOL_BUILD_CONCURRENCY)
+        self._tasks = set()
+        self.hits: Dict[int, int] = defaultdict(int)
+        self.misses: Dict[int, int] = defaultdict(int)
+
+    def _recent_claims(self, stack_id: int) -> int:
+        claims = self._claims[stack_id]
+        cutoff = datetime.utcnow() - timedelta(minutes=PREPARED_POOL_DEMAND_WINDOW_MINUTES)
+        while claims and claims[0] < cutoff:
+            claims.popleft()
+        return len(claims)
+
+    def target_size(self, stack_id: int) -> int:
+        per_minute = self._recent_claims(stack_id) / PREPARED_POOL_DEMAND_WINDOW_MINUTES
+        target = math.ceil(per_minute * PREPARED_POOL_LOOKAHEAD_MINUTES)
+        return max(
+            MIN_PREPARED_SANDBOXES_PER_STACK,
+            min(TARGET_PREPARED_SANDBOXES_PER_STACK, target),
+        )
+
+    def _take_oldest(self, db: Session, stack: Stack) -> Optional[PreparedSandbox]:
+        return (
+            db.query(PreparedSandbox)
+            .filter(
+                PreparedSandbox.stack_id == stack.id,
+                PreparedSandbox.pack_hash == stack.pack_hash,
+            )
+            .order_by(PreparedSandbox.created_at)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+
+    def claim(self, db: Session, stack: Stack) -> Optional[str]:
+        """Take a prepared sandbox for the stack. Must be committed with the project update."""
+        self._claims[stack.id].append(datetime.utcnow())
+        prepared = self._take_oldest(db, stack)
+        if prepared is not None:
+            db.delete(prepared)
+            if os.path.isdir(_get_sandbox_path(prepared.modal_sandbox_id)):
+                self.hits[stack.id] += 1
+                SANDBOX_POOL_CLAIMS.labels(stack_id=str(stack.id), result="hit").inc()
+                return prepared.modal_sandbox_id
+        self.misses[stack.id] += 1
+        SANDBOX_POOL_CLAIMS.labels(stack_id=str(stack.id), result="miss").inc()
+        return None
+
+    async def _build(self, stack_id: int):
+        try:
+            async with self._build_semaphore:
+                db = SessionLocal()
+                try:
+                    stack = db.query(Stack).filter(Stack.id == stack_id).first()
+                    _, sandbox_id = await DevSandbox.prepare_sandbox(stack)
+                    db.add(
+                        PreparedSandbox(
+                            modal_sandbox_id=sandbox_id,
+                            stack_id=stack.id,
+                            pack_hash=stack.pack_hash,
+                            created_at=datetime.utcnow(),
+                        )
+                    )
+                    db.commit()
+                    print(f"Created new prepared sandbox {sandbox_id} for stack {stack.id}")
+                finally:
+                    db.close()
+        except Exception as e:
+            print(
+                f"Failed to create prepared sandbox for stack {stack_id}: {e}\n{traceback.format_exc()}"
+            )
+        finally:
+            self._building[stack_id] -= 1
+
+    def _start_build(self, stack_id: int):
+        self._building[stack_id] += 1
+        task = asyncio.create_task(self._build(stack_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _evict_stale(self, db: Session, stacks: List[Stack]):
+        pack_hashes = {stack.id: stack.pack_hash for stack in stacks}
+        prepared = db.query(PreparedSandbox).with_for_update(skip_locked=True).all()
+        for p in prepared:
+            if pack_hashes.get(p.stack_id) != p.pack_hash:
+                _remove_sandbox_dir(p.modal_sandbox_id)
+                db.delete(p)
+                print(f"Evicted stale prepared sandbox {p.modal_sandbox_id} (stack {p.stack_id})")
+        db.commit()
+
+        if os.path.isdir(TEMPLATE_ROOT):
+            for name in os.listdir(TEMPLATE_ROOT):
+                # Names containing "." are templates still being built
+                if "." not in name and name not in pack_hashes.values():
+                    shutil.rmtree(os.path.join(TEMPLATE_ROOT, name), ignore_errors=True)
+
+    def _pool_size(self, db: Session, stack: Stack) -> int:
+        return (
+            db.query(PreparedSandbox)
+            .filter(
+                PreparedSandbox.stack_id == stack.id,
+                PreparedSandbox.pack_hash == stack.pack_hash,
+            )
+            .count()
+        )
+
+    async def maintain(self, db: Session):
+        stacks = db.query(Stack).all()
+        self._evict_stale(db, stacks)
+
+        for stack in stacks:
+            existing = self._pool_size(db, stack)
+            target = self.target_size(stack.id)
+            for _ in range(target - existing - self._building[stack.id]):
+                self._start_build(stack.id)
+            for _ in range(existing - target):
+                prepared = self._take_oldest(db, stack)
+                if prepared is None:
+                    break
+                _remove_sandbox_dir(prepared.modal_sandbox_id)
+                db.delete(prepared)
+            db.commit()
+
+    def stats(self, db: Session) -> Dict[int, Dict[str, int]]:
+        return {
+            stack.id: {
+                "size": self._pool_size(db, stack),
+                "target": self.target_size(stack.id),
+                "building": self._building[stack.id],
+                "recent_claims": self._recent_claims(stack.id),
+                "hits": self.hits[stack.id],
+                "misses": self.misses[stack.id],
+            }
+            for stack in db.query(Stack).all()
+        }
+
+
+pool_scheduler = PoolScheduler()
+
+
+def _prepared_sandbox_counts() -> Dict[tuple, int]:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(PreparedSandbox.stack_id, func.count(PreparedSandbox.id))
+            .group_by(PreparedSandbox.stack_id)
+            .all()
+        )
+        return {(stack_id,): count for stack_id, count in rows}
+    finally:
+        db.close()
+
+
+PREPARED_SANDBOXES.set_function(_prepared_sandbox_counts)
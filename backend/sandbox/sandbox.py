@@ -1,10 +1,15 @@
 import os
+import io
+import re
 import asyncio
 import base64
 import datetime
 import shutil
 import uuid
-from typing import List, Optional, Tuple, AsyncGenerator, Union
+import shlex
+import zipfile
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, AsyncGenerator, Union
 from asyncio import Lock
 from functools import lru_cache
 import subprocess
@@ -12,9 +17,17 @@ import aiofiles
 
 from db.database import get_db
 from db.models import Project, PreparedSandbox, Stack
+from sandbox.deps import dependency_store, SANDBOX_ENV
+from sandbox.lifecycle import lifecycle_manager
+from sandbox.tunnels import tunnel_registry, preview_path
+from config import DEV_SERVER_READY_TIMEOUT_SECONDS
 
 SANDBOX_ROOT = "/tmp/promptstudio/sandboxes"
+TEMPLATE_ROOT = "/tmp/promptstudio/templates"
 IGNORE_PATHS = ["node_modules", ".git", ".next", "build", "git.log", "tmp"]
+ZIP_CHUNK_SIZE = 64 * 1024
+# Deflated chunks buffered between the zip worker and the response
+ZIP_QUEUE_CHUNKS = 16
 
 @lru_cache()
 def _get_project_lock(project_id: int) -> Lock:
@@ -23,6 +36,10 @@ def _get_project_lock(project_id: int) -> Lock:
 class SandboxNotReadyException(Exception):
     pass
 
+@lru_cache()
+def _get_template_lock(pack_hash: str) -> Lock:
+    return Lock()
+
 def _unique_id():
     return str(uuid.uuid4())
 
@@ -32,9 +49,66 @@ def _ensure_sandbox_dir():
 def _get_sandbox_path(sandbox_id: str) -> str:
     return os.path.join(SANDBOX_ROOT, sandbox_id)
 
-async def _is_url_up(url: str) -> bool:
-    # Local dev always returns True since we're not using real sandboxes
-    return True
+def _get_template_path(pack_hash: str) -> str:
+    return os.path.join(TEMPLATE_ROOT, pack_hash)
+
+def _localize_command(command: str, sandbox_path: str) -> str:
+    """Point stack commands written for a container's /app at the local sandbox directory."""
+    return re.sub(r"(?<![\w./-])/app(?=/|\s|$|;|')", sandbox_path, command)
+
+async def _exec_shell(command: str, cwd: str) -> Tuple[str, int]:
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env={**os.environ, **SANDBOX_ENV},
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    finally:
+        # Don't leave the command running if the caller was cancelled
+        if proc.returncode is None:
+            proc.kill()
+    return (stdout or b"").decode() + (stderr or b"").decode(), proc.returncode
+
+async def _run_shell(command: str, cwd: str) -> str:
+    output, _ = await _exec_shell(command, cwd)
+    return output
+
+async def _ensure_template(stack: Stack) -> str:
+    """Build the golden sandbox for a stack's pack_hash once; later sandboxes are cloned from it."""
+    template_path = _get_template_path(stack.pack_hash)
+    async with _get_template_lock(stack.pack_hash):
+        if os.path.isdir(template_path):
+            return template_path
+        build_path = f"{template_path}.{_unique_id()}"
+        os.makedirs(build_path)
+        try:
+            await _run_shell("git init", build_path)
+            if stack.sandbox_init_cmd:
+                await _run_shell(
+                    _localize_command(stack.sandbox_init_cmd, build_path), build_path
+                )
+            # Dependencies live in the shared store and are linked into each clone
+            await dependency_store.ingest(build_path, remove=True)
+            os.rename(build_path, template_path)
+        finally:
+            shutil.rmtree(build_path, ignore_errors=True)
+    return template_path
+
+async def _clone_template(stack: Stack, sandbox_id: str):
+    template_path = await _ensure_template(stack)
+    _ensure_sandbox_dir()
+    sandbox_path = _get_sandbox_path(sandbox_id)
+    # Reflinks make this a copy-on-write clone on btrfs/xfs and a plain copy elsewhere
+    out = await _run_shell(
+        f"cp -a --reflink=auto {shlex.quote(template_path)} {shlex.quote(sandbox_path)}",
+        SANDBOX_ROOT,
+    )
+    if not os.path.isdir(sandbox_path):
+        raise SandboxNotReadyException(f"Failed to clone template for stack {stack.id}: {out}")
+    await dependency_store.link(sandbox_path)
 
 def _ends_with_ignore_path(path: str):
     path_parts = path.split("/")
@@ -44,46 +118,116 @@ def _ends_with_ignore_path(path: str):
 
 async def _get_paths(root_path: str) -> List[str]:
     paths = []
-    for root, _, files in os.walk(root_path):
+    for root, dirs, files in os.walk(root_path):
+        # Prune ignored directories so we never descend into node_modules etc.
+        dirs[:] = [d for d in dirs if d not in IGNORE_PATHS]
         for file in files:
-            full_path = os.path.join(root, file)
-            if not _ends_with_ignore_path(full_path):
-                paths.append(os.path.relpath(full_path, root_path))
+            rel_path = os.path.relpath(os.path.join(root, file), root_path)
+            if not _ends_with_ignore_path(rel_path):
+                paths.append(rel_path)
     return sorted(paths)
 
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink that collects zip output so it can be yielded in chunks."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
 def _strip_app_prefix(path: str) -> str:
     if path.startswith("/app/"):
         return path[len("/app/"):]
     return path
 
+class _ZipStopped(Exception):
+    pass
+
+def _write_zip(root: str, paths: List[str], emit: Callable[[bytes], None]):
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path in paths:
+            full_path = os.path.join(root, path)
+            if not os.path.isfile(full_path):
+                continue
+            info = zipfile.ZipInfo.from_file(full_path, path)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(full_path, "rb") as src, zf.open(info, "w") as dst:
+                while chunk := src.read(ZIP_CHUNK_SIZE):
+                    dst.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        emit(data)
+            data = buffer.drain()
+            if data:
+                emit(data)
+    data = buffer.drain()
+    if data:
+        emit(data)
+
 class DevSandbox:
-    def __init__(self, project_id: int, sandbox_id: str):
+    def __init__(self, project_id: int, sandbox_id: str, start_cmd: Optional[str] = None):
         self.project_id = project_id
         self.sandbox_id = sandbox_id
         self.sandbox_path = _get_sandbox_path(sandbox_id)
+        self.start_cmd = start_cmd
         self.ready = True
         _ensure_sandbox_dir()
 
-    async def is_up(self):
-        return True
+    async def is_up(self) -> bool:
+        server = lifecycle_manager.server(self.sandbox_id)
+        if server is None:
+            # Stacks without a start command have nothing to wait for
+            return not self.start_cmd
+        return await server.is_up()
 
-    async def wait_for_up(self):
-        self.ready = True
+    async def wait_for_up(self, timeout: float = DEV_SERVER_READY_TIMEOUT_SECONDS) -> bool:
+        server = lifecycle_manager.server(self.sandbox_id)
+        if server is None:
+            self.ready = not self.start_cmd
+        else:
+            self.ready = await server.wait_for_up(timeout)
+        return self.ready
+
+    def get_dev_server_logs(self) -> Dict[str, List[str]]:
+        server = lifecycle_manager.server(self.sandbox_id)
+        return server.logs() if server else {"stdout": [], "stderr": []}
+
+    async def start_dev_server(self):
+        start_cmd = self.start_cmd and _localize_command(self.start_cmd, self.sandbox_path)
+        env = {**os.environ, **SANDBOX_ENV, "BASE_PATH": preview_path(self.project_id)}
+        tunnel_registry.register(self.project_id, self.sandbox_id)
+        await lifecycle_manager.resume(self.sandbox_id, self.sandbox_path, start_cmd, env)
+
+    async def get_tunnels(self) -> Dict[int, str]:
+        return tunnel_registry.get_tunnels(self.project_id)
+
+    async def hibernate(self):
+        await lifecycle_manager.hibernate(self.sandbox_id)
 
     async def get_file_paths(self) -> List[str]:
         paths = await _get_paths(self.sandbox_path)
         return ["/app/" + path for path in paths]
 
     async def run_command(self, command: str, workdir: Optional[str] = None) -> str:
-        work_dir = workdir or self.sandbox_path
-        proc = await asyncio.create_subprocess_shell(
-            command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=work_dir
-        )
-        stdout, stderr = await proc.communicate()
-        return (stdout or b"").decode() + (stderr or b"").decode()
+        return await _run_shell(command, workdir or self.sandbox_path)
+
+    async def exec_command(
+        self, command: str, workdir: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """run_command() that also returns the exit code."""
+        return await _exec_shell(command, workdir or self.sandbox_path)
 
     async def run_command_stream(
         self, command: str, workdir: Optional[str] = None
@@ -92,11 +236,63 @@ class DevSandbox:
         proc = await asyncio.create_subprocess_shell(
             command,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=work_dir
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=work_dir,
+            env={**os.environ, **SANDBOX_ENV},
         )
-        async for line in proc.stderr:
-            yield line.decode()
+        try:
+            async for line in proc.stdout:
+                yield line.decode()
+            await proc.wait()
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    async def get_head_sha(self) -> Optional[str]:
+        out = await self.run_command("git rev-parse HEAD")
+        match = re.search(r"\b[0-9a-f]{40}\b", out)
+        return match.group(0) if match else None
+
+    async def stream_zip(self) -> AsyncGenerator[bytes, None]:
+        """Zip the (ignore-filtered) sandbox tree, yielding the archive as it is built.
+
+        Reading and deflating happen in a worker thread, which hands chunks
+        to the event loop through a bounded queue.
+        """
+        paths = await _get_paths(self.sandbox_path)
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=ZIP_QUEUE_CHUNKS)
+        stopped = threading.Event()
+
+        def emit(item):
+            if stopped.is_set():
+                raise _ZipStopped()
+            # Blocks the worker while the consumer is behind
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def build():
+            try:
+                _write_zip(self.sandbox_path, paths, emit)
+                emit(None)
+            except _ZipStopped:
+                pass
+            except Exception as e:
+                if not stopped.is_set():
+                    emit(e)
+
+        worker = loop.run_in_executor(None, build)
+        try:
+            while (item := await chunks.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            # Unblock a pending put so the worker sees the stop flag
+            while not chunks.empty():
+                chunks.get_nowait()
+            await worker
 
     async def write_file_contents_and_commit(
         self, files: List[Tuple[str, str]], commit_message: str
@@ -108,8 +304,16 @@ class DevSandbox:
                 f.write(content)
         
         await self.run_command("git add -A")
-        await self.run_command(f'git commit -m "{commit_message}"')
+        await self.run_command(f"git commit -m {shlex.quote(commit_message)}")
+        await self.run_command('git log --pretty="%h|%s|%aN|%aE|%aD" -n 50 > git.log')
+
+    async def amend_commit_message(self, sha: str, commit_message: str) -> bool:
+        """Reword HEAD, but only if it is still the given commit."""
+        if await self.get_head_sha() != sha:
+            return False
+        await self.run_command(f"git commit --amend -m {shlex.quote(commit_message)}")
         await self.run_command('git log --pretty="%h|%s|%aN|%aE|%aD" -n 50 > git.log')
+        return True
 
     async def read_file_contents(self, path: str, does_not_exist_ok: bool = False) -> str:
         full_path = os.path.join(self.sandbox_path, _strip_app_prefix(path))
@@ -134,6 +338,8 @@ class DevSandbox:
     @classmethod
     async def terminate_project_resources(cls, project: Project):
         if project.sandbox_id:
+            tunnel_registry.unregister(project.id)
+            await lifecycle_manager.forget(project.sandbox_id)
             sandbox_path = _get_sandbox_path(project.sandbox_id)
             if os.path.exists(sandbox_path):
                 shutil.rmtree(sandbox_path)
@@ -164,7 +370,11 @@ class DevSandbox:
             await lock.acquire()
             db = next(get_db())
             project = db.query(Project).filter(Project.id == project_id).first()
-            stack = db.query(Stack).filter(Stack.id == project.stack_id).first()
+            stack = (
+                db.query(Stack).filter(Stack.id == project.stack_id).first()
+                if project
+                else None
+            )
             if not project or not stack:
                 raise SandboxNotReadyException(
                     f"Project or stack not found (project={project_id})"
@@ -176,19 +386,20 @@ class DevSandbox:
                         f"No sandbox found for project (project={project_id})"
                     )
                 
-                # Create new sandbox
-                sandbox_id = _unique_id()
+                from sandbox.pool import pool_scheduler
+
+                # Claim a prepared sandbox, falling back to cloning the stack template
+                sandbox_id = pool_scheduler.claim(db, stack)
+                if sandbox_id:
+                    print(f"Claimed prepared sandbox {sandbox_id} for project {project_id}")
+                else:
+                    sandbox_id = _unique_id()
+                    await _clone_template(stack, sandbox_id)
                 project.sandbox_id = sandbox_id
                 db.commit()
-
-                # Initialize sandbox
-                sandbox = cls(project_id, sandbox_id)
-                sandbox_path = _get_sandbox_path(sandbox_id)
-                os.makedirs(sandbox_path, exist_ok=True)
-                await sandbox.run_command("git init")
-                return sandbox
+                return cls(project_id, sandbox_id, stack.sandbox_start_cmd)
             
-            return cls(project_id, project.sandbox_id)
+            return cls(project_id, project.sandbox_id, stack.sandbox_start_cmd)
         finally:
             lock.release()
 
@@ -196,14 +407,5 @@ class DevSandbox:
     async def prepare_sandbox(cls, stack: Stack) -> Tuple["DevSandbox", str]:
         sandbox_id = _unique_id()
         sandbox = cls(-1, sandbox_id)  # Use -1 as project_id for prepared sandboxes
-        
-        # Create sandbox directory
-        sandbox_path = _get_sandbox_path(sandbox_id)
-        os.makedirs(sandbox_path, exist_ok=True)
-        
-        # Initialize sandbox with stack
-        await sandbox.run_command("git init")
-        if stack.sandbox_init_cmd:
-            await sandbox.run_command(stack.sandbox_init_cmd)
-        
+        await _clone_template(stack, sandbox_id)
         return sandbox, sandbox_id
\ No newline at end of file
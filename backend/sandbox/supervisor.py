@@ -0,0 +1,189 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config import (
+    DEV_SERVER_PORT_START,
+    DEV_SERVER_PORT_END,
+    DEV_SERVER_LOG_LINES,
+)
+
+_MIN_BACKOFF_SECONDS = 1.0
+_MAX_BACKOFF_SECONDS = 30.0
+# A server that stayed up this long is considered healthy and resets the backoff
+_HEALTHY_RUN_SECONDS = 60.0
+_MIN_PROBE_SECONDS = 0.01
+_MAX_PROBE_SECONDS = 1.0
+
+
+def _is_port_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+class PortAllocator:
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self._ports: Dict[str, int] = {}
+
+    def allocate(self, sandbox_id: str) -> int:
+        if sandbox_id in self._ports:
+            return self._ports[sandbox_id]
+        used = set(self._ports.values())
+        for port in range(self.start, self.end):
+            if port not in used and _is_port_free(port):
+                self._ports[sandbox_id] = port
+                return port
+        raise RuntimeError(f"No free dev server ports in {self.start}-{self.end}")
+
+    def get(self, sandbox_id: str) -> Optional[int]:
+        return self._ports.get(sandbox_id)
+
+    def release(self, sandbox_id: str):
+        self._ports.pop(sandbox_id, None)
+
+
+port_allocator = PortAllocator(DEV_SERVER_PORT_START, DEV_SERVER_PORT_END)
+
+
+async def is_port_open(port: int, host: str = "127.0.0.1") -> bool:
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+class DevServer:
+    """Runs a sandbox's start command, captures its output and restarts it on crash."""
+
+    def __init__(self, sandbox_id: str, sandbox_path: str, command: str, env: Dict[str, str]):
+        self.sandbox_id = sandbox_id
+        self.sandbox_path = sandbox_path
+        self.command = command
+        self.port = port_allocator.allocate(sandbox_id)
+        self.env = {**env, "PORT": str(self.port)}
+        self.stdout: Deque[str] = deque(maxlen=DEV_SERVER_LOG_LINES)
+        self.stderr: Deque[str] = deque(maxlen=DEV_SERVER_LOG_LINES)
+        self.restarts = 0
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._up = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self.proc is None or self.proc.returncode is not None:
+            return None
+        return self.proc.pid
+
+    async def _pipe(self, stream: asyncio.StreamReader, buffer: Deque[str]):
+        async for line in stream:
+            buffer.append(line.decode(errors="replace").rstrip("\n"))
+
+    async def _probe(self):
+        delay = _MIN_PROBE_SECONDS
+        while not await is_port_open(self.port):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _MAX_PROBE_SECONDS)
+        self._up.set()
+        print(f"Dev server {self.sandbox_id} is up on port {self.port}")
+
+    async def _run_once(self) -> int:
+        self._up.clear()
+        self.proc = await asyncio.create_subprocess_shell(
+            self.command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.sandbox_path,
+            env=self.env,
+            start_new_session=True,
+        )
+        probe = asyncio.create_task(self._probe())
+        try:
+            await asyncio.gather(
+                self._pipe(self.proc.stdout, self.stdout),
+                self._pipe(self.proc.stderr, self.stderr),
+            )
+            return await self.proc.wait()
+        finally:
+            probe.cancel()
+            self._up.clear()
+
+    async def _supervise(self):
+        backoff = _MIN_BACKOFF_SECONDS
+        while not self._stopping:
+            started_at = time.monotonic()
+            try:
+                code = await self._run_once()
+            except Exception as e:
+                code = None
+                print(f"Error running dev server {self.sandbox_id}: {e}\n{traceback.format_exc()}")
+            if self._stopping:
+                break
+            if time.monotonic() - started_at > _HEALTHY_RUN_SECONDS:
+                backoff = _MIN_BACKOFF_SECONDS
+            self.restarts += 1
+            print(f"Dev server {self.sandbox_id} exited ({code}), restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, _MAX_BACKOFF_SECONDS)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        proc = self.proc
+        if proc is not None and proc.returncode is None:
+            for sig in (signal.SIGTERM, signal.SIGKILL):
+                try:
+                    os.killpg(proc.pid, sig)
+                except ProcessLookupError:
+                    break
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def is_up(self) -> bool:
+        return self.pid is not None and self._up.is_set()
+
+    async def wait_for_up(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._up.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def logs(self) -> Dict[str, List[str]]:
+        return {"stdout": list(self.stdout), "stderr": list(self.stderr)}
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from jose import jwt, JWTError
+
+from config import JWT_SECRET_KEY, PREVIEW_BASE_URL, PREVIEW_TOKEN_HOURS
+from sandbox.lifecycle import lifecycle_manager
+from sandbox.supervisor import DevServer
+
+# Port the frontend reads from ProjectStatusResponse.tunnels
+PREVIEW_PORT = 3000
+
+
+# Keeps preview tokens from ever being accepted as user tokens, and vice versa
+PREVIEW_TOKEN_AUDIENCE = "preview"
+# /preview/<project id>/_token/<token>/<page> sets the preview cookie and redirects to the page
+PREVIEW_TOKEN_SEGMENT = "_token"
+
+
+def preview_path(project_id: int) -> str:
+    return f"/preview/{project_id}/"
+
+
+def create_preview_token(project_id: int) -> str:
+    expires = datetime.now(timezone.utc) + timedelta(hours=PREVIEW_TOKEN_HOURS)
+    return jwt.encode(
+        {"sub": str(project_id), "aud": PREVIEW_TOKEN_AUDIENCE, "exp": expires},
+        JWT_SECRET_KEY,
+        algorithm="HS256",
+    )
+
+
+def verify_preview_token(project_id: int, token: Optional[str]) -> Optional[datetime]:
+    """When the token expires, None if it is not a valid preview token for the project."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(
+            token, JWT_SECRET_KEY, algorithms=["HS256"], audience=PREVIEW_TOKEN_AUDIENCE
+        )
+    except JWTError:
+        return None
+    if payload.get("sub") != str(project_id):
+        return None
+    return datetime.fromtimestamp(payload["exp"], timezone.utc)
+
+
+class TunnelRegistry:
+    """Maps projects to their sandbox dev server so previews are proxied by this process."""
+
+    def __init__(self):
+        self._sandboxes: Dict[int, str] = {}
+
+    def register(self, project_id: int, sandbox_id: str):
+        self._sandboxes[project_id] = sandbox_id
+
+    def unregister(self, project_id: int):
+        self._sandboxes.pop(project_id, None)
+
+    def get_sandbox_id(self, project_id: int) -> Optional[str]:
+        return self._sandboxes.get(project_id)
+
+    def get_server(self, project_id: int) -> Optional[DevServer]:
+        sandbox_id = self._sandboxes.get(project_id)
+        server = sandbox_id and lifecycle_manager.server(sandbox_id)
+        if not server or not server.running:
+            return None
+        return server
+
+    def get_tunnels(self, project_id: int) -> Dict[int, str]:
+        """Signed preview URLs; clients append the page path to them as before."""
+        url = PREVIEW_BASE_URL.rstrip("/") + preview_path(project_id)
+        return {PREVIEW_PORT: f"{url}{PREVIEW_TOKEN_SEGMENT}/{create_preview_token(project_id)}"}
+
+
+tunnel_registry = TunnelRegistry()
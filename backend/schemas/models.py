@@ -175,5 +175,14 @@ class TeamMemberResponse(TeamMemberBase):
         from_attributes = True
 
 
+class UsageResponse(BaseModel):
+    project_id: int
+    phase: str
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+
+
 class PreviewUrlResponse(BaseModel):
     preview_url: str
\ No newline at end of file
@@ -0,0 +1,230 @@
+import io
+import os
+import re
+import time
+import uuid
+import asyncio
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Set
+
+import aiofiles
+from fastapi import Request
+from PIL import Image
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from agents.images import (
+    PROCESSED_KEY_PREFIX,
+    PROCESSED_KEY_RE,
+    UPLOADED_IMAGE_PREFIX,
+    ProcessedImage,
+    open_image,
+    preprocess_image,
+)
+from db.database import SessionLocal
+from db.models import Message
+from config import (
+    UPLOADS_DIR,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_GC_GRACE_HOURS,
+    UPLOAD_GC_INTERVAL_MINUTES,
+)
+
+CHUNK_SIZE = 64 * 1024
+# Allowance for the multipart boundaries and part headers around the image
+MULTIPART_OVERHEAD = 16 * 1024
+# Advisory lock id held by the worker collecting garbage, so only one does at a time
+_GC_LOCK_ID = 0x75706C6F6164  # "upload"
+# Thumbnail widths clients may ask for, so variants on disk stay bounded
+THUMBNAIL_WIDTHS = (64, 128, 256, 512)
+THUMBNAIL_QUALITY = 75
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadStore:
+    """Content-addressed image uploads: sha256/<hash>.<ext> blobs, their thumbnails
+    under thumbnails/, and a garbage collector for blobs no message references."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._tmp = self.root / "tmp"
+        self._blobs = self.root / PROCESSED_KEY_PREFIX.rstrip("/")
+        self._thumbnails = self.root / "thumbnails"
+        for path in (self._tmp, self._blobs, self._thumbnails):
+            path.mkdir(parents=True, exist_ok=True)
+        # Thumbnail path -> [lock, tasks holding or waiting for it]
+        self._thumbnail_locks: Dict[str, List] = {}
+        self._next_gc = 0.0
+
+    def _too_large(self) -> UploadTooLarge:
+        return UploadTooLarge(f"Upload exceeds the {self.max_bytes // (1024 * 1024)}MB limit")
+
+    async def _limited_body(self, request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > self.max_bytes + MULTIPART_OVERHEAD:
+                raise self._too_large()
+            yield chunk
+
+    async def _receive(self, request: Request) -> FormData:
+        """Parse the multipart body, enforcing the size limit on the raw bytes as they
+        arrive. FastAPI's own form parsing would have spooled a body of any size first."""
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes + MULTIPART_OVERHEAD:
+            raise self._too_large()
+        if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+            raise ValueError("Expected a multipart/form-data upload")
+        parser = MultiPartParser(
+            request.headers, self._limited_body(request), max_files=1, max_fields=10
+        )
+        try:
+            return await parser.parse()
+        except MultiPartException as e:
+            raise ValueError(str(e))
+
+    async def save_image(self, request: Request) -> str:
+        """Store a preprocessed copy of the image in the request's multipart "file" field,
+        returns its file key. Raises UploadTooLarge, or ValueError if it is not an image."""
+        form = await self._receive(request)
+        try:
+            file = form.get("file")
+            if not isinstance(file, UploadFile):
+                raise ValueError('Expected an image in the "file" field')
+            if file.size is not None and file.size > self.max_bytes:
+                raise self._too_large()
+            image = await asyncio.to_thread(_preprocess_file, file.file)
+        finally:
+            await form.close()
+
+        path = self.root / image.file_key
+        if path.exists():
+            # Identical upload: keep the blob, but restart its garbage collection grace period
+            os.utime(path)
+            return image.file_key
+        tmp_path = self._tmp / uuid.uuid4().hex
+        async with aiofiles.open(tmp_path, "wb") as out:
+            for start in range(0, len(image.data), CHUNK_SIZE):
+                await out.write(image.data[start : start + CHUNK_SIZE])
+        os.replace(tmp_path, path)
+        return image.file_key
+
+    def path(self, file_key: str) -> Optional[Path]:
+        """The file for a key, None if it does not exist or points outside the store."""
+        path = (self.root / file_key).resolve()
+        if not path.is_relative_to(self.root.resolve()) or not path.is_file():
+            return None
+        return path
+
+    def blob_hash(self, file_key: str) -> Optional[str]:
+        """The content hash of content-addressed keys (None for pre-hashing uploads)."""
+        match = PROCESSED_KEY_RE.match(file_key)
+        return match.group(1) if match else None
+
+    async def thumbnail(self, file_key: str, width: int) -> Optional[Path]:
+        """A WebP of the image at most width pixels wide, generated on first request.
+        None if the image does not exist or can't be decoded."""
+        source = self.path(file_key)
+        if source is None:
+            return None
+        digest = self.blob_hash(file_key) or re.sub(r"[^\w.-]", "_", file_key)
+        path = self._thumbnails / f"{digest}-{width}.webp"
+        if path.exists():
+            return path
+        # Dropped only once nobody waits on it, so a late request can't make a second lock
+        entry = self._thumbnail_locks.setdefault(str(path), [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if not path.exists():
+                    await asyncio.to_thread(_write_thumbnail, source, path, self._tmp, width)
+        except ValueError as e:
+            # Uploads from before preprocessing were stored as sent
+            print(f"Can't thumbnail {file_key}: {e}")
+            return None
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._thumbnail_locks[str(path)]
+        return path
+
+    def _referenced_hashes(self, db: Session) -> Set[str]:
+        hashes = set()
+        rows = (
+            db.query(Message.images)
+            .filter(Message.images.isnot(None))
+            .execution_options(yield_per=1000)
+        )
+        for (images,) in rows:
+            for image in images:
+                digest = self.blob_hash(image.removeprefix(UPLOADED_IMAGE_PREFIX))
+                if digest:
+                    hashes.add(digest)
+        return hashes
+
+    async def collect_garbage(self, force: bool = False) -> int:
+        """Delete blobs (and their thumbnails) that no message references and that are
+        past the grace period uploads get before being sent. Returns how many were deleted."""
+        if not force and time.monotonic() < self._next_gc:
+            return 0
+        self._next_gc = time.monotonic() + UPLOAD_GC_INTERVAL_MINUTES * 60
+        return await asyncio.to_thread(self._collect_garbage)
+
+    def _collect_garbage(self) -> int:
+        # Runs in a thread, so it needs a session of its own
+        db = SessionLocal()
+        try:
+            # Workers share the uploads directory; whichever gets the lock collects this
+            # round and the others skip. Released when the transaction ends
+            if not db.execute(select(func.pg_try_advisory_xact_lock(_GC_LOCK_ID))).scalar():
+                return 0
+            referenced = self._referenced_hashes(db)
+            cutoff = time.time() - UPLOAD_GC_GRACE_HOURS * 60 * 60
+            return self._delete_unreferenced(referenced, cutoff)
+        finally:
+            db.close()
+
+    def _delete_unreferenced(self, referenced: Set[str], cutoff: float) -> int:
+        deleted = 0
+        for entry in os.scandir(self._blobs):
+            digest = entry.name.split(".")[0]
+            if digest in referenced or entry.stat().st_mtime > cutoff:
+                continue
+            os.remove(entry.path)
+            deleted += 1
+        blobs = {entry.name.split(".")[0] for entry in os.scandir(self._blobs)}
+        for entry in os.scandir(self._thumbnails):
+            digest = entry.name.rsplit("-", 1)[0]
+            if len(digest) == 64 and digest not in blobs:
+                os.remove(entry.path)
+        # Temp files left behind by interrupted uploads
+        for entry in os.scandir(self._tmp):
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        return deleted
+
+
+def _preprocess_file(file: BinaryIO) -> ProcessedImage:
+    file.seek(0)
+    return preprocess_image(file.read())
+
+
+def _write_thumbnail(source: Path, path: Path, tmp_dir: Path, width: int):
+    with open_image(source, width) as image:
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=THUMBNAIL_QUALITY)
+    tmp_path = tmp_dir / uuid.uuid4().hex
+    tmp_path.write_bytes(out.getvalue())
+    os.replace(tmp_path, path)
+
+
+upload_store = UploadStore(UPLOADS_DIR, UPLOAD_MAX_BYTES)
@@ -4,9 +4,14 @@ import functools
 import asyncio
 from datetime import datetime, timedelta
 
-from routers.project_socket import project_managers
-from db.models import Stack, PreparedSandbox, Project
+from routers.project_socket import project_managers, project_relays
+from db.models import Project
+from db.cluster import project_bus, project_leases
 from sandbox.sandbox import DevSandbox
+from sandbox.pool import pool_scheduler
+from sandbox.lifecycle import lifecycle_manager
+from storage.uploads import upload_store
+from config import SANDBOX_HIBERNATE_MINUTES, MULTI_WORKER
 
 
 def task_handler():
@@ -37,34 +42,48 @@ async def cleanup_inactive_project_managers():
         print(f"Cleaned up inactive project manager for project {project_id}")
 
 
+@task_handler()
+async def renew_project_leases(db: Session):
+    """Keep this worker's project leases alive and drop relays whose owner went away"""
+    if not MULTI_WORKER:
+        return
+    project_bus.ensure_connected()
+    lost = project_leases.renew(db, list(project_managers))
+    for project_id in lost:
+        # Another worker took over (e.g. we stalled past the lease), stop competing with it
+        manager = project_managers.pop(project_id, None)
+        if manager is not None:
+            await manager.kill()
+            print(f"Lost lease for project {project_id}, stopped its manager")
+    for project_id, relay in list(project_relays.items()):
+        if not project_leases.is_held(db, project_id):
+            # Clients reconnect and one of the workers claims the project
+            await relay.close_all(code=1012)
+
+
+@task_handler()
+async def hibernate_idle_sandboxes():
+    """Stop dev servers of sandboxes nobody is connected to, keeping their files"""
+    active_sandbox_ids = [
+        manager.sandbox.sandbox_id
+        for manager in project_managers.values()
+        if manager.sandbox and manager.chat_sockets
+    ]
+    await lifecycle_manager.hibernate_idle(active_sandbox_ids, SANDBOX_HIBERNATE_MINUTES)
+
+
 @task_handler()
 async def maintain_prepared_sandboxes(db: Session):
-    """Maintain a pool of prepared sandboxes for each stack"""
-    # Get all stacks
-    stacks = db.query(Stack).all()
-    
-    for stack in stacks:
-        # Count existing prepared sandboxes for this stack
-        existing_count = db.query(PreparedSandbox).filter(
-            PreparedSandbox.stack_id == stack.id
-        ).count()
-        
-        # Create new sandboxes if needed (maintain 2 prepared sandboxes per stack)
-        while existing_count < 2:
-            try:
-                sandbox, sandbox_id = await DevSandbox.prepare_sandbox(stack)
-                prepared = PreparedSandbox(
-                    modal_sandbox_id=sandbox_id,
-                    stack_id=stack.id,
-                    created_at=datetime.utcnow()
-                )
-                db.add(prepared)
-                db.commit()
-                existing_count += 1
-                print(f"Created new prepared sandbox {sandbox_id} for stack {stack.id}")
-            except Exception as e:
-                print(f"Failed to create prepared sandbox for stack {stack.id}: {e}")
-                break
+    """Maintain a demand-sized pool of prepared sandboxes for each stack"""
+    await pool_scheduler.maintain(db)
+
+
+@task_handler()
+async def collect_upload_garbage():
+    """Delete uploaded images no chat message references (at most once per interval)"""
+    deleted = await upload_store.collect_garbage()
+    if deleted:
+        print(f"Deleted {deleted} unreferenced uploads")
 
 
 @task_handler()
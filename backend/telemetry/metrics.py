@@ -0,0 +1,169 @@
+import time
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+
+from db.database import engine
+
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class LabelledCallbackGauge(Collector):
+    """A labelled gauge read from a callback at scrape time, which prometheus_client's
+    Gauge.set_function only supports without labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = list(labelnames)
+        self._function: Optional[Callable[[], Dict[Tuple, float]]] = None
+        REGISTRY.register(self)
+
+    def set_function(self, function: Callable[[], Dict[Tuple, float]]):
+        """function returns {label values tuple: number}."""
+        self._function = function
+
+    def collect(self):
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                # Keep the rest of the scrape working, e.g. while the database is down
+                print(f"Error collecting metric {self.name}: {e}")
+                values = {}
+            for key, value in values.items():
+                family.add_metric([str(v) for v in key], value)
+        yield family
+
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending an LLM request to its first streamed content.",
+    ["provider", "model", "phase"],
+    buckets=LLM_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "llm_duration_seconds",
+    "Total duration of an LLM call.",
+    ["provider", "model", "phase"],
+    buckets=LLM_BUCKETS,
+)
+LLM_ERRORS = Counter(
+    "llm_errors",
+    "LLM calls that raised.",
+    ["provider", "model", "phase"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens",
+    "LLM tokens by kind (prompt, completion, cached).",
+    ["provider", "model", "phase", "kind"],
+)
+SANDBOX_COMMAND_DURATION = Histogram(
+    "sandbox_command_duration_seconds",
+    "Duration of agent run_command calls in a sandbox.",
+)
+SANDBOX_COMMANDS = Counter(
+    "sandbox_commands",
+    "Agent run_command calls by exit code.",
+    ["exit_code"],
+)
+FILE_APPLY_DURATION = Histogram(
+    "file_apply_duration_seconds",
+    "Time to parse, write and commit the file changes of a chat turn.",
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries issued while handling an HTTP request.",
+    ["method", "route"],
+    buckets=COUNT_BUCKETS,
+)
+ACTIVE_WEBSOCKETS = Gauge(
+    "active_websockets",
+    "Open chat websockets on this worker.",
+)
+PROJECT_MANAGERS = Gauge(
+    "project_managers",
+    "Project managers running on this worker.",
+)
+COMPLETION_CACHE_LOOKUPS = Counter(
+    "completion_cache_lookups",
+    "Helper prompt completion cache lookups by result (memory_hit, db_hit, miss).",
+    ["result"],
+)
+SANDBOX_POOL_CLAIMS = Counter(
+    "sandbox_pool_claims",
+    "Prepared sandbox claims by stack and result (hit, miss).",
+    ["stack_id", "result"],
+)
+PREPARED_SANDBOXES = LabelledCallbackGauge(
+    "prepared_sandboxes",
+    "Prepared sandboxes ready to be claimed, by stack.",
+    ["stack_id"],
+)
+
+
+# Mutable so increments made in threadpool copies of the request's context are seen
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("_request_queries", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(*args):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@contextmanager
+def count_queries():
+    """Counts database queries made from the current context, yields a [count] list."""
+    counter = [0]
+    token = _request_queries.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_queries.reset(token)
+
+
+@contextmanager
+def observe_llm_call(provider: str, model: str, phase: str):
+    """Times a non-streaming LLM call."""
+    labels = {"provider": provider, "model": model, "phase": phase}
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_ERRORS.labels(**labels).inc()
+        raise
+    LLM_DURATION.labels(**labels).observe(time.perf_counter() - started)
+
+
+async def observe_llm_stream(stream, provider: str, model: str, phase: str):
+    """Passes a provider stream through, timing its first content chunk and completion."""
+    labels = {"provider": provider, "model": model, "phase": phase}
+    started = time.perf_counter()
+    first_token = True
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                if first_token and chunk.get("type") == "content":
+                    first_token = False
+                    LLM_TIME_TO_FIRST_TOKEN.labels(**labels).observe(
+                        time.perf_counter() - started
+                    )
+                yield chunk
+    except Exception:
+        LLM_ERRORS.labels(**labels).inc()
+        raise
+    LLM_DURATION.labels(**labels).observe(time.perf_counter() - started)
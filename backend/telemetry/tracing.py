@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set
+
+import httpx
+
+from config import TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT
+
+SERVICE_NAME = "promptstudio-backend"
+
+# OTLP span kind and status codes
+_KIND_INTERNAL = 1
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A finished-or-running operation, exported in the OpenTelemetry (OTLP JSON) span format."""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": (
+                {"code": _STATUS_ERROR, "message": self.error}
+                if self.error
+                else {"code": _STATUS_OK}
+            ),
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "promptstudio"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class SpanExporter:
+    """Buffers a trace's spans until its root ends, then writes it as one OTLP JSON line
+    (readable by the collector's otlpjsonfile receiver) and/or posts it to an OTLP/HTTP collector."""
+
+    def __init__(self, path: Optional[str], endpoint: Optional[str]):
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") if endpoint else None
+        self.enabled = bool(path or endpoint)
+        self._traces: Dict[str, List[Span]] = {}
+        self._open_roots: Set[str] = set()
+        self._client = httpx.AsyncClient(timeout=10.0) if endpoint else None
+        self._tasks = set()
+
+    def start(self, span: Span):
+        if self.enabled and span.parent_span_id is None:
+            self._open_roots.add(span.trace_id)
+
+    def end(self, span: Span):
+        if not self.enabled:
+            return
+        self._traces.setdefault(span.trace_id, []).append(span)
+        if span.parent_span_id is None:
+            self._open_roots.discard(span.trace_id)
+        # Spans outliving their root (e.g. background work) are flushed on their own
+        if span.trace_id not in self._open_roots:
+            self._flush(self._traces.pop(span.trace_id))
+
+    def _flush(self, spans: List[Span]):
+        payload = _otlp_payload(spans)
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(payload) + "\n")
+            except OSError as e:
+                print(f"Failed to write trace: {e}")
+        if self._client is not None:
+            try:
+                task = asyncio.get_running_loop().create_task(self._post(payload))
+            except RuntimeError:
+                return
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, payload: Dict[str, Any]):
+        try:
+            await self._client.post(f"{self.endpoint}/v1/traces", json=payload)
+        except httpx.HTTPError as e:
+            print(f"Failed to export trace: {e}")
+
+
+exporter = SpanExporter(TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT)
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as a child of the current span (or a new trace)."""
+    s = Span(name, _current_span.get(), attributes)
+    exporter.start(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except (asyncio.CancelledError, GeneratorExit):
+        s.set_attribute("cancelled", True)
+        raise
+    except Exception as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end_ns = time.time_ns()
+        exporter.end(s)
+
+
+async def span_stream(name: str, stream: AsyncGenerator, **attributes):
+    """Yields from stream, timed as a span that is current only while the stream runs.
+
+    Use instead of span() around yields in async generators: the consumer resumes
+    in the same context, so a span left current across a yield would parent the
+    consumer's own spans (and outlive the consumer's context on early exit).
+    """
+    s = Span(name, _current_span.get(), attributes)
+    exporter.start(s)
+    try:
+        while True:
+            token = _current_span.set(s)
+            try:
+                item = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        s.set_attribute("cancelled", True)
+        raise
+    except Exception as e:
+        s.record_exception(e)
+        raise
+    finally:
+        # Cleanup in the stream (e.g. usage accounting) still belongs to the span
+        token = _current_span.set(s)
+        try:
+            await stream.aclose()
+        finally:
+            _current_span.reset(token)
+            s.end_ns = time.time_ns()
+            exporter.end(s)
@@ -16,6 +16,7 @@ import {
   MicOff,
   Share2,
   Link,
+  Square,
 } from 'lucide-react';
 import { Textarea } from '@/components/ui/textarea';
 import rehypeRaw from 'rehype-raw';
@@ -109,6 +110,7 @@ interface ChatInputProps {
   uploadingImages: boolean;
   status: string;
   onReconnect: () => void;
+  onCancel?: () => void;
   onSketchSubmit: (dataUrl: string) => void;
   messages: Message[];
 }
@@ -123,6 +125,7 @@ interface ChatProps {
   showStackPacks?: boolean;
   suggestedFollowUps?: string[];
   onReconnect: () => void;
+  onCancel?: () => void;
   chat?: Chat;
 }
 
@@ -325,6 +328,7 @@ const ChatInput = ({
   uploadingImages,
   status,
   onReconnect,
+  onCancel,
   onSketchSubmit,
   messages,
 }: ChatInputProps) => {
@@ -535,6 +539,20 @@ const ChatInput = ({
                 </TooltipTrigger>
                 <TooltipContent>Reconnect to server</TooltipContent>
               </Tooltip>
+            ) : status === 'WORKING' && onCancel ? (
+              <Tooltip>
+                <TooltipTrigger asChild>
+                  <Button
+                    type="button"
+                    size="icon"
+                    onClick={onCancel}
+                    variant="secondary"
+                  >
+                    <Square className="h-4 w-4" />
+                  </Button>
+                </TooltipTrigger>
+                <TooltipContent>Stop generating</TooltipContent>
+              </Tooltip>
             ) : (
               <Tooltip>
                 <TooltipTrigger asChild>
@@ -613,6 +631,7 @@ export function Chat({
   showStackPacks = false,
   suggestedFollowUps = [],
   onReconnect,
+  onCancel,
   chat,
 }: ChatProps) {
   const { projects } = useUser();
@@ -841,6 +860,7 @@ export function Chat({
           handleChipClick={handleChipClick}
           status={status}
           onReconnect={onReconnect}
+          onCancel={onCancel}
           suggestedFollowUps={
             suggestedFollowUps && suggestedFollowUps.length > 0
               ? suggestedFollowUps
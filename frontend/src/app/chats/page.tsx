@@ -48,6 +48,7 @@ interface SocketData {
   navigate_to?: string;
   content?: string;
   thinking_content?: string;
+  seq?: number;
 }
 
 const statusMap = {
@@ -108,6 +109,7 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
   const [previewHash, setPreviewHash] = useState<number>(1);
   const [status, setStatus] = useState<Status>('NEW_CHAT');
   const webSocketRef = useRef<ProjectWebSocketService | null>(null);
+  const lastSeqRef = useRef<number | null>(null);
   const { toast } = useToast();
   const [isMobile, setIsMobile] = useState<boolean>(false);
   const chat = chats?.find((c) => c.id === +chatId);
@@ -131,7 +133,7 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
     const connectWS = async () => {
       try {
         await new Promise<void>((resolve, reject) => {
-          ws.connect();
+          ws.connect(lastSeqRef.current);
           if (!ws.ws) {
             reject(new Error('WebSocket not initialized'));
             return;
@@ -140,12 +142,15 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
           ws.ws.onerror = (error) => reject(error);
           ws.ws.onmessage = (event) => {
             const data = JSON.parse(event.data) as SocketData;
+            if (data.seq) {
+              lastSeqRef.current = data.seq;
+            }
             handleSocketMessage(data);
           };
           ws.ws.onclose = (e) => {
             setStatus('DISCONNECTED');
             console.log('WebSocket connection closed', e.code, e.reason);
-            if ([1002, 1003].includes(e.code)) {
+            if ([1002, 1003, 1012].includes(e.code)) {
               initializeWebSocket(chatId);
             }
           };
@@ -163,6 +168,8 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
             handleChatUpdate(data);
           } else if (data.for_type === 'chat_chunk') {
             handleChatChunk(data);
+          } else if (data.for_type === 'replay_gap') {
+            handleReplayGap();
           }
         };
 
@@ -211,6 +218,12 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
           setPreviewHash((prev) => prev + 1);
         };
 
+        const handleReplayGap = async () => {
+          // Missed frames are no longer buffered server-side, reload the chat
+          const chat = await api.getChat(parseInt(chatId));
+          setMessages(chat.messages ?? []);
+        };
+
         const handleChatChunk = (data: SocketData) => {
           setMessages((prev) => {
             const lastMessage = prev[prev.length - 1];
@@ -248,6 +261,7 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
   };
 
   useEffect(() => {
+    lastSeqRef.current = null;
     if (chatId !== 'new') {
       initializeWebSocket(chatId).catch((error) => {
         console.error('Failed to initialize WebSocket:', error);
@@ -367,6 +381,10 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
     }
   };
 
+  const handleCancel = () => {
+    webSocketRef.current?.cancel();
+  };
+
   useEffect(() => {
     const checkMobile = () => {
       setIsMobile(window.innerWidth < 768);
@@ -405,6 +423,7 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
                 showStackPacks={chatId === 'new'}
                 suggestedFollowUps={suggestedFollowUps}
                 onReconnect={handleReconnect}
+                onCancel={handleCancel}
               />
             </div>
             <div className={`h-full ${isPreviewOpen ? 'block' : 'hidden'}`}>
@@ -443,6 +462,7 @@ export default function WorkspacePage({ chatId }: WorkspacePageProps) {
               showStackPacks={chatId === 'new'}
               suggestedFollowUps={suggestedFollowUps}
               onReconnect={handleReconnect}
+              onCancel={handleCancel}
             />
             <RightPanel
               onSendMessage={handleSendMessage}
@@ -28,6 +28,12 @@ export interface Chat {
   id: number;
   name: string;
   is_public: boolean;
+  messages?: {
+    id: number;
+    role: string;
+    content: string;
+    images?: string[];
+  }[];
   project?: {
     id: number;
   };
@@ -33,7 +33,7 @@ export class ProjectWebSocketService {
     this.chatId = chatId;
   }
 
-  connect(): void {
+  connect(lastSeq?: number | null): void {
     const wsUrl = api.getBaseURL();
     const wsProtocol = wsUrl.startsWith('https') ? 'wss://' : 'ws://';
     const baseUrl = wsUrl.replace(/^https?:\/\//, '');
@@ -45,8 +45,10 @@ export class ProjectWebSocketService {
       return;
     }
 
+    // Lets the server replay chat frames missed while disconnected
+    const resume = lastSeq ? `&last_seq=${lastSeq}` : '';
     this.ws = new WebSocket(
-      `${wsProtocol}${baseUrl}/api/ws/chat/${this.chatId}?token=${token}`
+      `${wsProtocol}${baseUrl}/api/ws/chat/${this.chatId}?token=${token}${resume}`
     );
   }
 
@@ -65,6 +67,14 @@ export class ProjectWebSocketService {
     }
   }
 
+  cancel(): void {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ action: 'cancel' }));
+    } else {
+      console.error('WebSocket is not connected');
+    }
+  }
+
   public onOpen(callback: () => void) {
     if (this.ws) {
       this.ws.onopen = callback;